@@ -0,0 +1,129 @@
+import logging
+import math
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+
+from fastapi import HTTPException, status
+
+from config import settings
+from job_queue import job_queue
+from metrics import metrics, Sample
+
+logger = logging.getLogger(__name__)
+
+class AdmissionController:
+    """Decides whether /upload may add work, from queue depth and measured job time.
+
+    The estimated wait is pending jobs divided by the drain rate (live
+    worker slots / mean job duration). New uploads are refused with 503 and
+    a Retry-After when the backlog or the wait passes its limit, and with 429
+    when one student already has too much in flight. The same snapshot feeds
+    the autoscaling gauges on /metrics.
+    """
+
+    def __init__(self, queue):
+        self.queue = queue
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._snapshot_at = 0.0
+
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        """Queue depth and capacity, refreshed at most every ADMISSION_SNAPSHOT_SECONDS"""
+        if self.queue is None:
+            return None
+        with self._lock:
+            if self._snapshot is not None and time.monotonic() - self._snapshot_at < settings.ADMISSION_SNAPSHOT_SECONDS:
+                return self._snapshot
+        try:
+            snapshot = {**self.queue.depth(), **self.queue.capacity()}
+        except Exception as e:
+            logger.warning(f"Could not read queue state for admission control: {e}")
+            return None
+
+        job_seconds = snapshot["avg_job_seconds"] or settings.ADMISSION_DEFAULT_JOB_SECONDS
+        slots = snapshot["worker_slots"]
+        snapshot["job_seconds"] = job_seconds
+        snapshot["estimated_wait_seconds"] = snapshot["pending"] * job_seconds / slots if slots else None
+        snapshot["desired_worker_slots"] = snapshot["running"] + math.ceil(
+            snapshot["pending"] * job_seconds / settings.ADMISSION_TARGET_WAIT_SECONDS
+        )
+
+        with self._lock:
+            self._snapshot, self._snapshot_at = snapshot, time.monotonic()
+        return snapshot
+
+    def admit(self, student_id: int) -> Optional[float]:
+        """Raise 429/503 when over capacity; otherwise the estimated seconds until the analysis is done"""
+        if not settings.ADMISSION_CONTROL_ENABLED:
+            return None
+        snapshot = self.snapshot()
+        if snapshot is None:
+            # No queue: uploads run inline and there is nothing to measure
+            return None
+        job_seconds = snapshot["job_seconds"]
+
+        try:
+            backlog = self.queue.student_backlog(student_id)
+        except Exception:
+            backlog = 0
+        if backlog >= settings.ADMISSION_MAX_PER_STUDENT:
+            per_student = max(settings.JOB_MAX_RUNNING_PER_STUDENT, 1)
+            retry_after = job_seconds * (backlog - settings.ADMISSION_MAX_PER_STUDENT + 1) / per_student
+            self._reject(
+                status.HTTP_429_TOO_MANY_REQUESTS,
+                "per_student",
+                f"You already have {backlog} analyses in progress; please wait for some to finish",
+                retry_after
+            )
+
+        wait = snapshot["estimated_wait_seconds"]
+        if wait is None:
+            if snapshot["pending"] > 0:
+                self._reject(
+                    status.HTTP_503_SERVICE_UNAVAILABLE,
+                    "no_workers",
+                    "No analysis workers are running; please try again shortly",
+                    settings.ADMISSION_DEFAULT_JOB_SECONDS
+                )
+            wait = 0.0
+
+        if snapshot["pending"] >= settings.ADMISSION_MAX_PENDING or wait > settings.ADMISSION_MAX_WAIT_SECONDS:
+            # Time for the backlog to drain back under both limits
+            excess_jobs = snapshot["pending"] - settings.ADMISSION_MAX_PENDING + 1
+            drain_rate = snapshot["worker_slots"] / job_seconds
+            retry_after = max(excess_jobs / drain_rate, wait - settings.ADMISSION_MAX_WAIT_SECONDS)
+            self._reject(
+                status.HTTP_503_SERVICE_UNAVAILABLE,
+                "backlog",
+                f"Analysis backlog is full (about {int(wait)}s wait); please try again later",
+                retry_after
+            )
+
+        metrics.inc("upload_admitted_total")
+        return round(wait + job_seconds, 1)
+
+    def _reject(self, status_code: int, reason: str, detail: str, retry_after: float):
+        retry_after = min(max(int(math.ceil(retry_after)), 1), settings.ADMISSION_MAX_WAIT_SECONDS)
+        metrics.inc("upload_rejected_total", reason=reason)
+        raise HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": str(retry_after)})
+
+admission_controller = AdmissionController(job_queue)
+
+def _autoscale_samples() -> Iterable[Sample]:
+    """Backlog and capacity gauges for an autoscaler scraping /metrics"""
+    snapshot = admission_controller.snapshot()
+    if snapshot is None:
+        return
+    for lane, pending in snapshot["lanes"].items():
+        yield "analysis_queue_pending", {"lane": lane}, pending
+    yield "analysis_queue_running", {}, snapshot["running"]
+    yield "analysis_queue_delayed", {}, snapshot["delayed"]
+    yield "analysis_queue_dead", {}, snapshot["dead"]
+    yield "analysis_worker_slots", {}, snapshot["worker_slots"]
+    yield "analysis_job_seconds_avg", {}, snapshot["job_seconds"]
+    if snapshot["estimated_wait_seconds"] is not None:
+        yield "analysis_estimated_wait_seconds", {}, snapshot["estimated_wait_seconds"]
+    yield "analysis_desired_worker_slots", {}, snapshot["desired_worker_slots"]
+
+metrics.register_collector(_autoscale_samples)
@@ -0,0 +1,300 @@
+import json
+import logging
+import math
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from analysis_store import upsert_analysis_results
+from claim_check import build_claim_check_payload
+from config import settings
+from database import SessionLocal
+from deadline import Deadline, current_deadline, deadline_scope, degradation_level
+from llm_gateway import llm_gateway, template_scope
+from models import Assignment, AnalysisResult, AssignmentChunk, Student
+from n8n_client import trigger_analysis
+from rag_service import rag_service
+from resubmission import reanalyze_revision
+from topic_classifier import topic_classifier
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ANALYSIS = {
+    "themes": ["General academic themes detected"],
+    "research_questions": ["Further research needed"],
+    "suggestions": ["Expand on key themes", "Add more depth"],
+    "citation_style": "APA",
+    "confidence_score": 0.7
+}
+
+def build_analysis_prompt(
+    topic: str,
+    academic_level: str,
+    word_count: int,
+    text_preview: str,
+    sources: List[Dict[str, Any]]
+) -> str:
+    """Same prompt as the workflow's "Prepare AI Analysis Prompt" node"""
+    sources_text = "\n".join(
+        f"- {s.get('title')} by {s.get('authors')} ({s.get('source_type')})" for s in sources
+    )
+    return f"""You are an academic writing assistant analyzing a student assignment.
+
+Assignment Details:
+- Topic: {topic}
+- Academic Level: {academic_level}
+- Word Count: {word_count}
+- Preview: {text_preview}
+
+Available Academic Sources:
+{sources_text}
+
+Please provide:
+1. Assessment of the assignment topic and key themes
+2. Research questions that could be explored
+3. Suggestions for improving the research depth
+4. Recommendations for citation style (APA, MLA, Chicago)
+5. Confidence score (0-1) for the analysis
+
+Format your response as JSON with keys: themes, research_questions, suggestions, citation_style, confidence_score"""
+
+def parse_analysis_response(response_text: str) -> Dict[str, Any]:
+    """Parse the model's JSON answer, tolerating ```json fences; defaults like the workflow on failure"""
+    cleaned = re.sub(r"^```(?:json)?\s*|\s*```$", "", (response_text or "").strip())
+    try:
+        parsed = json.loads(cleaned)
+        if isinstance(parsed, dict):
+            return parsed
+    except ValueError:
+        pass
+    return dict(DEFAULT_ANALYSIS)
+
+def structure_results(analysis_data: Dict[str, Any], sources: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Shape LLM output like the workflow's "Structure Analysis Results" node"""
+    suggestions = analysis_data.get("suggestions")
+    if isinstance(suggestions, list):
+        research_suggestions = "; ".join(str(s) for s in suggestions)
+    elif isinstance(suggestions, str):
+        research_suggestions = suggestions
+    else:
+        research_suggestions = ""
+    if not research_suggestions.strip():
+        research_suggestions = "Expand on key themes and add more depth"
+
+    return {
+        "suggested_sources": [
+            {
+                "title": s.get("title"),
+                "authors": s.get("authors"),
+                "source_type": s.get("source_type"),
+                "relevance": "high"
+            }
+            for s in sources
+        ],
+        "research_suggestions": research_suggestions,
+        "citation_recommendations": f"Use {analysis_data.get('citation_style') or 'APA'} format for citations",
+        "confidence_score": analysis_data.get("confidence_score") or 0.75
+    }
+
+class AnalysisIncomplete(Exception):
+    """Too little of the analysis ran to store a result; the job fails and is retried"""
+
+class AnalysisPipeline:
+    """In-process version of the n8n analysis workflow.
+
+    Runs topic detection, retrieval, plagiarism detection, the LLM call and
+    storage directly against the database and RAGService. Each stage has its
+    own concurrency limit so, for example, a burst of LLM calls cannot take
+    every database connection.
+    """
+
+    STAGES = ("topic", "retrieval", "plagiarism", "llm", "storage")
+
+    def __init__(self):
+        self._limits = {
+            "topic": threading.BoundedSemaphore(settings.PIPELINE_TOPIC_CONCURRENCY),
+            "retrieval": threading.BoundedSemaphore(settings.PIPELINE_RETRIEVAL_CONCURRENCY),
+            "plagiarism": threading.BoundedSemaphore(settings.PIPELINE_PLAGIARISM_CONCURRENCY),
+            "llm": threading.BoundedSemaphore(settings.PIPELINE_LLM_CONCURRENCY),
+            "storage": threading.BoundedSemaphore(settings.PIPELINE_STORAGE_CONCURRENCY),
+        }
+
+    @contextmanager
+    def _stage(self, name: str, timings: Dict[str, float]):
+        with self._limits[name]:
+            started = time.monotonic()
+            try:
+                yield
+            finally:
+                timings[name] = time.monotonic() - started
+
+    def run(self, assignment_id: int, deadline: Optional[Deadline] = None) -> Optional[AnalysisResult]:
+        db = SessionLocal()
+        try:
+            with deadline_scope(deadline):
+                return self._run(db, assignment_id)
+        finally:
+            db.close()
+
+    def _run(self, db: Session, assignment_id: int) -> Optional[AnalysisResult]:
+        assignment = db.query(Assignment).filter(Assignment.id == assignment_id).first()
+        if assignment is None:
+            logger.warning(f"Assignment {assignment_id} no longer exists; skipping analysis")
+            return None
+
+        timings: Dict[str, float] = {}
+        preview = self._preview(db, assignment)
+        deadline = current_deadline()
+        # Fallbacks taken to stay inside the deadline; recorded on the result
+        degraded: List[str] = []
+
+        def budget() -> float:
+            return deadline.remaining() if deadline is not None else math.inf
+
+        with self._stage("topic", timings):
+            # Uploads are classified on their full text; only older rows lack a topic
+            if not assignment.topic:
+                detected = topic_classifier.classify(preview, assignment.word_count or 0)
+                assignment.topic = detected["topic"]
+                assignment.academic_level = detected["academic_level"]
+                db.commit()
+
+        with self._stage("retrieval", timings):
+            if budget() < settings.DEADLINE_RETRIEVAL_MIN_SECONDS:
+                sources = rag_service.lexical_search_sources(db, preview, limit=5)
+                degraded.append("lexical_retrieval")
+            else:
+                sources = rag_service.search_sources_for_assignment(db, assignment.id, limit=5)
+
+        with self._stage("plagiarism", timings):
+            plagiarism = rag_service.detect_plagiarism_incremental(
+                db, assignment.id, deadline=deadline, reserve_seconds=settings.DEADLINE_PLAGIARISM_RESERVE_SECONDS
+            )
+            if not plagiarism["complete"]:
+                if plagiarism["chunks_scanned"] == 0:
+                    # Nothing was checked; storing 0.0 would read as a clean result
+                    raise AnalysisIncomplete(f"Plagiarism scan of assignment {assignment_id} covered no chunks")
+                degraded.append("partial_plagiarism")
+
+        with self._stage("llm", timings):
+            prompt = build_analysis_prompt(
+                assignment.topic, assignment.academic_level, assignment.word_count or 0, preview, sources
+            )
+            llm_budget = budget() - settings.DEADLINE_STORAGE_RESERVE_SECONDS
+            cache_only = llm_budget < settings.DEADLINE_LLM_MIN_SECONDS
+            response_text = self._generate(
+                prompt, cache_only, None if cache_only or deadline is None else llm_budget,
+                semantic_text=preview,
+                scope=template_scope(assignment.topic, assignment.academic_level, [s.get("title") for s in sources])
+            )
+            if not response_text:
+                if not cache_only and budget() - settings.DEADLINE_STORAGE_RESERVE_SECONDS >= settings.DEADLINE_LLM_MIN_SECONDS:
+                    # A failed call with time to spare is transient; retry the job instead of storing the default
+                    raise AnalysisIncomplete(f"LLM call for assignment {assignment_id} failed")
+                degraded.append("default_llm")
+            elif cache_only:
+                degraded.append("cached_llm")
+            analysis_data = parse_analysis_response(response_text)
+
+        with self._stage("storage", timings):
+            fields = structure_results(analysis_data, sources)
+            fields["assignment_id"] = assignment.id
+            fields["plagiarism_score"] = round(plagiarism["plagiarism_score"], 3)
+            fields["flagged_sections"] = plagiarism["flagged_sections"]
+            fields["degradation_level"] = degradation_level(degraded)
+            fields["degraded_stages"] = degraded
+
+            upsert_analysis_results(db, [fields])
+            analysis = db.query(AnalysisResult).filter(AnalysisResult.assignment_id == assignment.id).first()
+
+        logger.info(
+            f"Native analysis of assignment {assignment_id} done: "
+            + ", ".join(f"{stage}={timings[stage]:.2f}s" for stage in self.STAGES)
+            + (f", degraded: {', '.join(degraded)}" if degraded else "")
+        )
+        return analysis
+
+    def _preview(self, db: Session, assignment: Assignment) -> str:
+        """First 100 words, from the stored text or, for streamed uploads, the first chunk"""
+        text = assignment.original_text
+        if text is None:
+            text = db.query(AssignmentChunk.content).filter(
+                AssignmentChunk.assignment_id == assignment.id,
+                AssignmentChunk.chunk_index == 0
+            ).scalar() or ""
+        return " ".join(text.split(" ")[:100])
+
+    def _generate(
+        self,
+        prompt: str,
+        cache_only: bool = False,
+        timeout: Optional[float] = None,
+        semantic_text: Optional[str] = None,
+        scope: Optional[str] = None
+    ) -> str:
+        # The gateway returns "" on failure or a cache miss
+        response_text, _ = llm_gateway.generate(
+            prompt, cache_only=cache_only, timeout=timeout, semantic_text=semantic_text, scope=scope
+        )
+        return response_text
+
+analysis_pipeline = AnalysisPipeline()
+
+def build_job_payload(
+    assignment: Assignment,
+    student: Student,
+    text: str,
+    file_path: Optional[str],
+    streamed: bool,
+    revision_check: bool = False
+) -> Dict[str, Any]:
+    """Analysis job / webhook body for an assignment.
+
+    With revision_check the job first tries an incremental re-analysis
+    against an earlier version of the same document.
+    """
+    payload = {
+        "assignment_id": assignment.id,
+        "student_id": student.id,
+        "student_email": student.email,
+        "filename": assignment.filename,
+        "file_path": file_path,
+        "text": text,
+        "word_count": assignment.word_count,
+        "topic": assignment.topic,
+        "academic_level": assignment.academic_level,
+        "streamed": streamed,
+        "revision_check": revision_check,
+        # The clock starts when the job is picked up, so queue wait never eats the budget
+        "deadline_seconds": settings.ANALYSIS_DEADLINE_SECONDS
+    }
+    if settings.WEBHOOK_CLAIM_CHECK:
+        # Ship a preview and a signed URL instead of the whole document
+        payload = build_claim_check_payload(payload)
+    return payload
+
+def _reanalyze_revision(assignment_id: int) -> bool:
+    db = SessionLocal()
+    try:
+        assignment = db.query(Assignment).filter(Assignment.id == assignment_id).first()
+        return assignment is not None and reanalyze_revision(db, assignment) is not None
+    finally:
+        db.close()
+
+def dispatch_analysis(payload: Dict[str, Any]):
+    """Run one queued analysis with the configured backend"""
+    if payload.get("revision_check") and _reanalyze_revision(payload["assignment_id"]):
+        return
+    deadline = None
+    if payload.get("deadline_seconds"):
+        deadline = Deadline.after(payload["deadline_seconds"])
+        # n8n forwards this to /internal/llm/generate
+        payload = {**payload, "deadline_at": deadline.at}
+    if settings.ANALYSIS_BACKEND == "native":
+        analysis_pipeline.run(payload["assignment_id"], deadline)
+    else:
+        trigger_analysis(payload)
@@ -0,0 +1,167 @@
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from config import settings
+from metrics import metrics
+from models import Assignment, AnalysisResult
+from notifications import publish_status
+
+logger = logging.getLogger(__name__)
+
+RESULT_FIELDS = (
+    "suggested_sources",
+    "plagiarism_score",
+    "flagged_sections",
+    "research_suggestions",
+    "citation_recommendations",
+    "confidence_score",
+    "reused_from_assignment_id",
+    "degradation_level",
+    "degraded_stages",
+)
+
+def analysis_payload(analysis) -> Dict[str, Any]:
+    """Client-facing view of an analysis row, shared by GET /analysis and status events"""
+    return {
+        "assignment_id": analysis.assignment_id,
+        "plagiarism_score": float(analysis.plagiarism_score) if analysis.plagiarism_score else 0.0,
+        "confidence_score": float(analysis.confidence_score) if analysis.confidence_score else 0.0,
+        "research_suggestions": analysis.research_suggestions or "No suggestions available",
+        "citation_recommendations": analysis.citation_recommendations or "Use APA format",
+        "suggested_sources": analysis.suggested_sources or [],
+        "flagged_sections": analysis.flagged_sections or [],
+        "reused_from_assignment_id": analysis.reused_from_assignment_id,
+        "degradation_level": analysis.degradation_level or 0,
+        "degraded_stages": analysis.degraded_stages or [],
+        "analyzed_at": analysis.analyzed_at.isoformat() if analysis.analyzed_at else None
+    }
+
+def _analysis_version(analysis) -> float:
+    return analysis.analyzed_at.timestamp() if analysis.analyzed_at else 0
+
+def analysis_etag(analysis) -> str:
+    """Strong validator: a new row id or a new analyzed_at means a new result"""
+    return f'"{analysis.id}-{_analysis_version(analysis):.6f}"'
+
+# Write a cache entry unless the one already there is newer. A reader that
+# loaded a result just before a re-check committed must not overwrite the
+# fresh entry publish_completed wrote with its stale copy.
+_CACHE_IF_NEWER = """
+local current = redis.call('GET', KEYS[1])
+if current then
+    local ok, entry = pcall(cjson.decode, current)
+    if ok and tonumber(entry['version'] or 0) > tonumber(ARGV[1]) then
+        return 0
+    end
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+def _connect() -> Optional[redis.Redis]:
+    try:
+        client = redis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            decode_responses=True,
+            socket_connect_timeout=5,
+            socket_timeout=5
+        )
+        client.ping()
+        return client
+    except redis.ConnectionError as e:
+        logger.error(f"❌ Analysis result cache disabled, Redis unavailable: {e}")
+        return None
+
+_cache = _connect()
+_cache_if_newer = _cache.register_script(_CACHE_IF_NEWER) if _cache is not None else None
+
+def _cache_key(assignment_id: int) -> str:
+    return f"analysis:result:{assignment_id}"
+
+def cached_analysis(assignment_id: int) -> Optional[Dict[str, Any]]:
+    """{"student_id", "etag", "payload"} for a completed analysis, without touching Postgres"""
+    if _cache is None:
+        return None
+    try:
+        cached = _cache.get(_cache_key(assignment_id))
+    except redis.RedisError as e:
+        logger.warning(f"Analysis cache read failed: {e}")
+        return None
+    metrics.inc("analysis_cache_total", result="hit" if cached else "miss")
+    return json.loads(cached) if cached else None
+
+def cache_analysis(student_id: int, analysis) -> Dict[str, Any]:
+    version = _analysis_version(analysis)
+    entry = {
+        "student_id": student_id,
+        "version": version,
+        "etag": analysis_etag(analysis),
+        "payload": analysis_payload(analysis)
+    }
+    if _cache is not None:
+        try:
+            _cache_if_newer(
+                keys=[_cache_key(analysis.assignment_id)],
+                args=[version, json.dumps(entry), settings.ANALYSIS_CACHE_TTL_SECONDS]
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Analysis cache write failed: {e}")
+    return entry
+
+def publish_completed(analysis, student_id: int):
+    """Every write of a result goes through here, so this is also where the cached copy is replaced.
+
+    Writing the new entry (rather than deleting the old one) means a reader
+    racing the commit can only fail to overwrite it, never re-cache the old result.
+    """
+    entry = cache_analysis(student_id, analysis)
+    publish_status(analysis.assignment_id, "completed", result=entry["payload"])
+
+def upsert_analysis_results(db: Session, results: List[Dict[str, Any]]) -> Tuple[List[int], List[int]]:
+    """Insert or replace analysis rows keyed by assignment_id in one statement.
+
+    Rows for assignments that do not exist are skipped rather than failing
+    the batch. Returns (stored_assignment_ids, missing_assignment_ids).
+    """
+    # Last write wins when a batch holds the same assignment twice; ON CONFLICT
+    # cannot touch one row twice in a statement
+    by_assignment = {result["assignment_id"]: result for result in results}
+    if not by_assignment:
+        return [], []
+
+    # Owner of each assignment, for the write-through cache entry
+    existing = dict(db.query(Assignment.id, Assignment.student_id).filter(
+        Assignment.id.in_(list(by_assignment))
+    ).all())
+    missing = sorted(set(by_assignment) - existing.keys())
+
+    rows = []
+    for assignment_id in sorted(existing):
+        result = by_assignment[assignment_id]
+        row = {"assignment_id": assignment_id}
+        row.update({field: result.get(field) for field in RESULT_FIELDS})
+        row["analyzed_at"] = result.get("analyzed_at") or datetime.utcnow()
+        rows.append(row)
+
+    stored = []
+    if rows:
+        stmt = insert(AnalysisResult).values(rows)
+        update_columns = {field: stmt.excluded[field] for field in RESULT_FIELDS}
+        update_columns["analyzed_at"] = stmt.excluded.analyzed_at
+        stored = db.execute(stmt.on_conflict_do_update(
+            index_elements=[AnalysisResult.assignment_id],
+            set_=update_columns
+        ).returning(*AnalysisResult.__table__.columns)).all()
+    db.commit()
+
+    for analysis in stored:
+        publish_completed(analysis, existing[analysis.assignment_id])
+
+    return [row["assignment_id"] for row in rows], missing
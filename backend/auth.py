@@ -1,23 +1,26 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from auth_cache import auth_cache
 from config import settings
-from database import get_db
+from database import AsyncSessionLocal, get_db
 from models import Student
+from password_hasher import password_hasher
 from schemas import TokenData
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    verified, _ = await password_hasher.verify_and_update(plain_password, hashed_password)
+    return verified
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    return await password_hasher.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -35,6 +38,9 @@ def verify_token(token: str) -> TokenData:
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    cached = auth_cache.get_token(token)
+    if cached is not None:
+        return cached
     try:
         payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
         email: str = payload.get("sub")
@@ -42,6 +48,7 @@ def verify_token(token: str) -> TokenData:
         if email is None or student_id is None:
             raise credentials_exception
         token_data = TokenData(email=email, student_id=student_id)
+        auth_cache.put_token(token, token_data, payload.get("exp"))
         return token_data
     except JWTError:
         raise credentials_exception
@@ -53,18 +60,39 @@ async def get_current_student(
     token = credentials.credentials
     token_data = verify_token(token)
 
-    student = db.query(Student).filter(Student.email == token_data.email).first()
+    # Cached identity: a detached Student carrying only the non-secret columns
+    # Both cache calls may go to Redis, so they run in the threadpool too
+    identity = await run_in_threadpool(auth_cache.get_student, token_data.email)
+    if identity is not None:
+        return Student(**identity)
+
+    # Keep the lookup off the event loop: asyncpg when enabled, otherwise the threadpool
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as async_db:
+            student = (await async_db.execute(
+                select(Student).where(Student.email == token_data.email)
+            )).scalar_one_or_none()
+    else:
+        student = await run_in_threadpool(
+            lambda: db.query(Student).filter(Student.email == token_data.email).first()
+        )
     if student is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Student not found"
         )
+    await run_in_threadpool(auth_cache.put_student, student)
     return student
 
-def authenticate_student(db: Session, email: str, password: str) -> Optional[Student]:
-    student = db.query(Student).filter(Student.email == email).first()
+async def authenticate_student(db: Session, email: str, password: str) -> Optional[Student]:
+    student = await run_in_threadpool(lambda: db.query(Student).filter(Student.email == email).first())
     if not student:
         return None
-    if not verify_password(password, student.password_hash):
+    verified, new_hash = await password_hasher.verify_and_update(password, student.password_hash)
+    if not verified:
         return None
+    if new_hash:
+        # Stored with an older BCRYPT_ROUNDS; upgrade while we have the plain password
+        student.password_hash = new_hash
+        await run_in_threadpool(db.commit)
     return student
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import redis
+
+from config import settings
+from metrics import metrics
+from schemas import TokenData
+
+logger = logging.getLogger(__name__)
+
+# Columns an authenticated handler may read from current_student; never the password hash
+IDENTITY_FIELDS = ("id", "email", "full_name", "student_id")
+
+def _connect() -> Optional[redis.Redis]:
+    try:
+        client = redis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            decode_responses=True,
+            socket_connect_timeout=5,
+            socket_timeout=5
+        )
+        client.ping()
+        return client
+    except redis.ConnectionError as e:
+        logger.error(f"❌ Shared auth cache disabled, Redis unavailable: {e}")
+        return None
+
+class _LRU:
+    """Bounded map whose entries expire at their own deadline"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: str, value: Any, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: str):
+        self._entries.pop(key, None)
+
+    def drop_where(self, predicate):
+        for key in [key for key, (_, value) in self._entries.items() if predicate(value)]:
+            del self._entries[key]
+
+class AuthCache:
+    """Verified JWTs and student identities, so authenticated requests skip the students query.
+
+    Decoded tokens are kept in-process until they expire (at most
+    AUTH_CACHE_TTL_SECONDS). Identities are kept in-process for
+    AUTH_CACHE_LOCAL_TTL_SECONDS and in Redis for AUTH_CACHE_TTL_SECONDS.
+    invalidate_student() clears this process and Redis at once; other
+    processes notice within the local TTL.
+    """
+
+    def __init__(self, redis_client=None):
+        self.redis = redis_client
+        self._lock = threading.Lock()
+        self._tokens = _LRU(settings.AUTH_CACHE_MAX_ENTRIES)
+        self._students = _LRU(settings.AUTH_CACHE_MAX_ENTRIES)
+
+    def get_token(self, token: str) -> Optional[TokenData]:
+        if not settings.AUTH_CACHE_ENABLED:
+            return None
+        with self._lock:
+            token_data = self._tokens.get(self._token_key(token))
+        metrics.inc("auth_cache_total", kind="token", result="hit" if token_data else "miss")
+        return token_data
+
+    def put_token(self, token: str, token_data: TokenData, expires_at: Optional[float]):
+        if not settings.AUTH_CACHE_ENABLED:
+            return
+        ttl = settings.AUTH_CACHE_TTL_SECONDS
+        if expires_at is not None:
+            ttl = min(ttl, expires_at - time.time())
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._tokens.put(self._token_key(token), token_data, ttl)
+
+    def get_student(self, email: str) -> Optional[Dict[str, Any]]:
+        if not settings.AUTH_CACHE_ENABLED:
+            return None
+        with self._lock:
+            identity = self._students.get(email)
+        if identity is not None:
+            metrics.inc("auth_cache_total", kind="student", result="hit")
+            return identity
+
+        if self.redis is not None:
+            try:
+                cached = self.redis.get(self._student_key(email))
+            except redis.RedisError as e:
+                logger.warning(f"Auth cache read failed: {e}")
+                cached = None
+            if cached:
+                identity = json.loads(cached)
+                with self._lock:
+                    self._students.put(email, identity, settings.AUTH_CACHE_LOCAL_TTL_SECONDS)
+                metrics.inc("auth_cache_total", kind="student", result="shared_hit")
+                return identity
+
+        metrics.inc("auth_cache_total", kind="student", result="miss")
+        return None
+
+    def put_student(self, student):
+        if not settings.AUTH_CACHE_ENABLED:
+            return
+        identity = {field: getattr(student, field) for field in IDENTITY_FIELDS}
+        with self._lock:
+            self._students.put(student.email, identity, settings.AUTH_CACHE_LOCAL_TTL_SECONDS)
+        if self.redis is not None:
+            try:
+                self.redis.setex(self._student_key(student.email), settings.AUTH_CACHE_TTL_SECONDS, json.dumps(identity))
+            except redis.RedisError as e:
+                logger.warning(f"Auth cache write failed: {e}")
+
+    def invalidate_student(self, email: str):
+        """Call after any change to a student account: update, password change, deletion"""
+        with self._lock:
+            self._students.pop(email)
+            self._tokens.drop_where(lambda token_data: token_data.email == email)
+        if self.redis is not None:
+            try:
+                self.redis.delete(self._student_key(email))
+            except redis.RedisError as e:
+                logger.warning(f"Auth cache invalidation failed for {email}: {e}")
+
+    def _token_key(self, token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def _student_key(self, email: str) -> str:
+        return f"auth:student:{email}"
+
+auth_cache = AuthCache(_connect())
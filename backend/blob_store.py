@@ -0,0 +1,156 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Any, BinaryIO, Dict, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import UploadBlob
+
+logger = logging.getLogger(__name__)
+
+class BlobStore:
+    """Content-addressed upload storage.
+
+    Files live at <root>/<aa>/<bb>/<sha256>, so identical uploads share one
+    copy no matter who uploaded them or what they were called. Reference
+    counts are kept in upload_blobs; unreferenced blobs are removed by
+    collect_garbage once they have been idle for the grace period.
+    Extracted text is cached next to the blob as <sha256>.extract.json.
+    """
+
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, root: str):
+        self.root = root
+        self.tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def _extraction_path(self, digest: str) -> str:
+        return self.path_for(digest) + ".extract.json"
+
+    def put(self, fileobj: BinaryIO) -> Tuple[str, str, int]:
+        """Stream an upload into the store, returning (digest, path, size)"""
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                while True:
+                    block = fileobj.read(self.CHUNK_SIZE)
+                    if not block:
+                        break
+                    hasher.update(block)
+                    tmp.write(block)
+                    size += len(block)
+
+            digest = hasher.hexdigest()
+            path = self.path_for(digest)
+            if os.path.exists(path):
+                # Already stored: refresh mtime so an in-progress GC pass leaves it alone
+                os.utime(path)
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            return digest, path, size
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def add_ref(self, db: Session, digest: str, size: int):
+        stmt = insert(UploadBlob).values(digest=digest, size=size, ref_count=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UploadBlob.digest],
+            set_={"ref_count": UploadBlob.ref_count + 1, "released_at": None}
+        )
+        db.execute(stmt)
+        db.commit()
+
+    def release(self, db: Session, digest: str):
+        db.execute(
+            text("""
+                UPDATE upload_blobs
+                SET ref_count = GREATEST(ref_count - 1, 0),
+                    released_at = CASE WHEN ref_count <= 1 THEN now() ELSE released_at END
+                WHERE digest = :digest
+            """),
+            {"digest": digest}
+        )
+        db.commit()
+
+    def get_cached_extraction(self, digest: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._extraction_path(digest), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable extraction cache for {digest}: {e}")
+            return None
+
+    def cache_extraction(self, digest: str, extraction: Dict[str, Any]):
+        path = self._extraction_path(digest)
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as tmp:
+                json.dump(extraction, tmp)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to cache extraction for {digest}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def collect_garbage(self, db: Session, grace_seconds: Optional[int] = None) -> int:
+        """Delete unreferenced blobs and stray files older than the grace period"""
+        grace_seconds = settings.BLOB_GC_GRACE_SECONDS if grace_seconds is None else grace_seconds
+        cutoff = time.time() - grace_seconds
+
+        rows = db.execute(
+            text("""
+                DELETE FROM upload_blobs
+                WHERE ref_count <= 0 AND released_at < :cutoff
+                RETURNING digest
+            """),
+            {"cutoff": datetime.utcnow() - timedelta(seconds=grace_seconds)}
+        ).fetchall()
+        db.commit()
+
+        removed = 0
+        for (digest,) in rows:
+            removed += self._remove_if_idle(self.path_for(digest), cutoff)
+            self._remove_if_idle(self._extraction_path(digest), cutoff)
+
+        # Files with no row at all, e.g. from uploads interrupted before add_ref
+        known = {digest for (digest,) in db.query(UploadBlob.digest)}
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                digest = name.split(".", 1)[0]
+                if dirpath == self.tmp_dir or digest not in known:
+                    removed += self._remove_if_idle(os.path.join(dirpath, name), cutoff)
+
+        if removed:
+            logger.info(f"Blob GC removed {removed} files")
+        return removed
+
+    def _remove_if_idle(self, path: str, cutoff: float) -> int:
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                return 1
+        except FileNotFoundError:
+            pass
+        return 0
+
+blob_store = BlobStore(os.path.join(settings.UPLOAD_DIR, "blobs"))
@@ -0,0 +1,190 @@
+import logging
+import random
+import threading
+import time
+from typing import Callable, Iterable, List
+
+import redis
+
+from metrics import metrics, Sample
+
+logger = logging.getLogger(__name__)
+
+class CircuitBreaker:
+    """Failure counter and open flag for one upstream, shared through Redis.
+
+    `failure_threshold` failures within `window_seconds` open the breaker in
+    every process at once; while open, allow() is False and callers fail
+    fast. A background thread in one process probes the upstream every
+    `probe_interval` seconds and closes the breaker on the first success.
+    The open flag expires after `open_seconds` unless a failed probe renews
+    it, so a dead prober cannot keep the breaker open forever.
+
+    Without Redis the same logic runs on process-local state.
+    """
+
+    _LOCAL_STATE_SECONDS = 1.0
+
+    def __init__(
+        self,
+        name: str,
+        probe: Callable[[], None],
+        redis_client=None,
+        failure_threshold: int = 5,
+        window_seconds: float = 60.0,
+        open_seconds: float = 30.0,
+        probe_interval: float = 10.0
+    ):
+        self.name = name
+        self.probe = probe
+        self.redis = redis_client
+        self.failure_threshold = failure_threshold
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.probe_interval = probe_interval
+
+        self._failures_key = f"breaker:{name}:failures"
+        self._open_key = f"breaker:{name}:open"
+        self._prober_key = f"breaker:{name}:prober"
+
+        self._lock = threading.Lock()
+        self._local_failures: List[float] = []
+        self._local_open_until = 0.0
+        self._cached_open = False
+        self._cached_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        return not self.is_open()
+
+    def is_open(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._cached_at < self._LOCAL_STATE_SECONDS:
+                return self._cached_open
+        if self.redis is not None:
+            try:
+                is_open = bool(self.redis.exists(self._open_key))
+            except redis.RedisError:
+                is_open = time.time() < self._local_open_until
+        else:
+            is_open = time.time() < self._local_open_until
+        with self._lock:
+            self._cached_open, self._cached_at = is_open, now
+        if is_open:
+            self._ensure_prober()
+        return is_open
+
+    def record_success(self):
+        if self.redis is not None:
+            try:
+                self.redis.delete(self._failures_key)
+            except redis.RedisError:
+                pass
+        with self._lock:
+            self._local_failures.clear()
+
+    def record_failure(self):
+        metrics.inc("circuit_breaker_failures_total", breaker=self.name)
+        failures = self._count_failure()
+        if failures >= self.failure_threshold:
+            self.trip()
+
+    def _count_failure(self) -> int:
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline()
+                pipe.incr(self._failures_key)
+                pipe.expire(self._failures_key, int(self.window_seconds))
+                return int(pipe.execute()[0])
+            except redis.RedisError:
+                pass
+        now = time.time()
+        with self._lock:
+            self._local_failures = [t for t in self._local_failures if now - t < self.window_seconds]
+            self._local_failures.append(now)
+            return len(self._local_failures)
+
+    def trip(self):
+        """Open the breaker everywhere and make sure someone is probing for recovery"""
+        logger.warning(f"Circuit breaker {self.name} opened")
+        metrics.inc("circuit_breaker_opened_total", breaker=self.name)
+        self._set_open()
+        self._ensure_prober()
+
+    def close(self):
+        logger.info(f"Circuit breaker {self.name} closed")
+        if self.redis is not None:
+            try:
+                self.redis.delete(self._open_key, self._failures_key)
+            except redis.RedisError:
+                pass
+        with self._lock:
+            self._local_open_until = 0.0
+            self._local_failures.clear()
+            self._cached_open, self._cached_at = False, time.monotonic()
+
+    def _set_open(self):
+        with self._lock:
+            self._local_open_until = time.time() + self.open_seconds
+            self._cached_open, self._cached_at = True, time.monotonic()
+        if self.redis is not None:
+            try:
+                self.redis.set(self._open_key, 1, px=int(self.open_seconds * 1000))
+            except redis.RedisError:
+                pass
+
+    def _ensure_prober(self):
+        with self._lock:
+            if self._probing:
+                return
+            self._probing = True
+        # Only one process probes; the others just read the shared flag
+        if self.redis is not None:
+            try:
+                acquired = self.redis.set(self._prober_key, 1, nx=True, px=int(self.open_seconds * 1000))
+            except redis.RedisError:
+                acquired = True
+            if not acquired:
+                with self._lock:
+                    self._probing = False
+                return
+        threading.Thread(target=self._probe_loop, name=f"breaker-probe-{self.name}", daemon=True).start()
+
+    def _probe_loop(self):
+        try:
+            while True:
+                time.sleep(self.probe_interval * random.uniform(0.5, 1.0))
+                try:
+                    self.probe()
+                except Exception as e:
+                    logger.info(f"Circuit breaker {self.name} probe failed: {e}")
+                    self._set_open()
+                    if self.redis is not None:
+                        try:
+                            self.redis.pexpire(self._prober_key, int(self.open_seconds * 1000))
+                        except redis.RedisError:
+                            pass
+                    continue
+                self.close()
+                return
+        finally:
+            if self.redis is not None:
+                try:
+                    self.redis.delete(self._prober_key)
+                except redis.RedisError:
+                    pass
+            with self._lock:
+                self._probing = False
+
+_breakers: List[CircuitBreaker] = []
+
+def register_breaker(breaker: CircuitBreaker) -> CircuitBreaker:
+    _breakers.append(breaker)
+    return breaker
+
+def _breaker_samples() -> Iterable[Sample]:
+    for breaker in _breakers:
+        yield "circuit_breaker_open", {"breaker": breaker.name}, int(breaker.is_open())
+
+metrics.register_collector(_breaker_samples)
@@ -0,0 +1,34 @@
+import hashlib
+import hmac
+import time
+from typing import Any, Dict
+
+from config import settings
+
+def _signature(assignment_id: int, expires: int) -> str:
+    message = f"assignment-text:{assignment_id}:{expires}".encode("utf-8")
+    return hmac.new(settings.JWT_SECRET_KEY.encode("utf-8"), message, hashlib.sha256).hexdigest()
+
+def sign_text_url(assignment_id: int) -> Dict[str, Any]:
+    """Short-lived signed URL for fetching slices of an assignment's text"""
+    expires = int(time.time()) + settings.CLAIM_CHECK_TTL_SECONDS
+    signature = _signature(assignment_id, expires)
+    return {
+        "text_url": (
+            f"{settings.BACKEND_INTERNAL_URL}/internal/assignments/{assignment_id}/text"
+            f"?expires={expires}&sig={signature}"
+        ),
+        "text_url_expires": expires
+    }
+
+def verify_text_signature(assignment_id: int, expires: int, signature: str) -> bool:
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(_signature(assignment_id, expires), signature)
+
+def build_claim_check_payload(webhook_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace the full text with a 100-word preview and a signed URL for the rest"""
+    payload = {key: value for key, value in webhook_data.items() if key != "text"}
+    payload["text_preview"] = " ".join((webhook_data.get("text") or "").split()[:100])
+    payload.update(sign_text_url(webhook_data["assignment_id"]))
+    return payload
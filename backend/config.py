@@ -7,12 +7,121 @@ class Settings(BaseSettings):
     POSTGRES_DB: str = "academic_helper"
     POSTGRES_USER: str = "student"
     POSTGRES_PASSWORD: str = "secure_password"
+    # Connections per engine are capped at pool_size + max_overflow, and every
+    # process that imports database.py has its own engine (two with
+    # DB_ASYNC_ENABLED). Against Postgres' default max_connections=100 (97
+    # usable) the compose stack uses at most: backend 15 (30 with async),
+    # worker 15 (WORKER_CONCURRENCY slots use one each), n8n's Postgres node
+    # about 10, and a few for pgAdmin/psql -- about 60, leaving room for one
+    # more backend replica. Request threads beyond the cap wait up to
+    # DB_POOL_TIMEOUT_SECONDS. Raise these only together with max_connections.
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: float = 10.0
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: int = 500
+    DB_ASYNC_ENABLED: bool = False  # asyncpg engine for async handlers
     JWT_SECRET_KEY: str
     JWT_ALGORITHM: str = "HS256"
     JWT_EXPIRATION_MINUTES: int = 1440
+    BCRYPT_ROUNDS: int = 12  # raising it rehashes each password at its next login
+    PASSWORD_HASH_WORKERS: int = 2  # cores bcrypt may use at once
+    PASSWORD_HASH_MAX_PENDING: int = 64
+    AUTH_CACHE_ENABLED: bool = True
+    AUTH_CACHE_TTL_SECONDS: int = 300
+    AUTH_CACHE_LOCAL_TTL_SECONDS: int = 30  # how long other processes may serve an invalidated identity
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
     N8N_WEBHOOK_URL: str = "http://n8n:5678/webhook/assignment"
+    N8N_WEBHOOK_TIMEOUT_SECONDS: int = 120
+    WEBHOOK_CLAIM_CHECK: bool = True
+    CLAIM_CHECK_TTL_SECONDS: int = 3600
+    CLAIM_CHECK_MAX_SLICE_CHARS: int = 65536
+    BACKEND_INTERNAL_URL: str = "http://backend:8000"
+    INTERNAL_API_TOKEN: str = ""
+    RETRIEVAL_MAX_CHUNKS: int = 8
+    ANALYSIS_BACKEND: str = "n8n"  # "n8n" or "native"
+    GEMINI_ANALYSIS_MODEL: str = "gemini-2.5-flash"
+    GEMINI_TRANSPORT: str = "grpc"  # one long-lived HTTP/2 channel; "rest" for HTTP/1.1
+    LLM_CACHE_TTL_SECONDS: int = 86400
+    LLM_SEMANTIC_CACHE_ENABLED: bool = False
+    LLM_SEMANTIC_CACHE_THRESHOLD: float = 0.97
+    LLM_SEMANTIC_CACHE_TTL_SECONDS: int = 21600
+    LLM_SEMANTIC_CACHE_MAX_ENTRIES: int = 500
+    LLM_REQUESTS_PER_MINUTE: int = 60  # shared by all processes through Redis
+    LLM_BURST: int = 10
+    LLM_BATCH_WINDOW_MS: int = 50
+    LLM_BATCH_MAX_SIZE: int = 32
+    LLM_DISPATCH_CONCURRENCY: int = 8
+    LLM_REQUEST_TIMEOUT_SECONDS: int = 300
+    TOPIC_TAXONOMY_PATH: str = ""  # JSON {"topics": {name: [phrases]}, "level_markers": [...]}
+    TOPIC_MIN_SCORE: float = 3.0
+    LEVEL_MARKER_DENSITY_HIGH: float = 8.0  # markers per 1000 words
+    LEVEL_MARKER_DENSITY_LOW: float = 1.0
+    LEVEL_MIN_DISTINCT_MARKERS: int = 4
+    NOTIFY_LAST_EVENT_TTL_SECONDS: int = 86400
+    ANALYSIS_CACHE_TTL_SECONDS: int = 3600
+    ANALYSIS_CACHE_MAX_AGE_SECONDS: int = 0  # browsers revalidate with If-None-Match every time
+    NOTIFY_KEEPALIVE_SECONDS: float = 15.0
+    HTTP_POOL_CONNECTIONS: int = 10
+    HTTP_POOL_MAXSIZE: int = 20
+    HTTP_POOL_BLOCK: bool = True
+    ANALYSIS_DEADLINE_SECONDS: int = 300  # from claim to stored result; queue wait is bounded by ADMISSION_MAX_WAIT_SECONDS
+    DEADLINE_RETRIEVAL_MIN_SECONDS: float = 30.0  # less left: lexical source search
+    DEADLINE_PLAGIARISM_RESERVE_SECONDS: float = 45.0  # stop scanning chunks with less left
+    DEADLINE_LLM_MIN_SECONDS: float = 10.0  # less left: cached LLM answer or default
+    DEADLINE_STORAGE_RESERVE_SECONDS: float = 5.0
+    EMBEDDING_CALL_DEADLINE_SECONDS: float = 8.0  # all attempts of one embedding call
+    EMBEDDING_MAX_ATTEMPTS: int = 3  # queued analyses only; request threads try once
+    EMBEDDING_RETRY_BASE_SECONDS: float = 0.25
+    EMBEDDING_RETRY_MAX_SECONDS: float = 2.0
+    EMBEDDING_BREAKER_FAILURE_THRESHOLD: int = 5
+    EMBEDDING_BREAKER_WINDOW_SECONDS: int = 60
+    EMBEDDING_BREAKER_OPEN_SECONDS: float = 30.0
+    EMBEDDING_BREAKER_PROBE_INTERVAL_SECONDS: float = 10.0
+    SINGLE_FLIGHT_LEASE_SECONDS: float = 15.0  # longest a caller waits on another's computation
+    SINGLE_FLIGHT_POLL_SECONDS: float = 0.05
+    SOURCE_SEARCH_CACHE_TTL_SECONDS: int = 300
+    PIPELINE_TOPIC_CONCURRENCY: int = 32
+    PIPELINE_RETRIEVAL_CONCURRENCY: int = 8
+    PIPELINE_PLAGIARISM_CONCURRENCY: int = 4
+    PIPELINE_LLM_CONCURRENCY: int = 8
+    PIPELINE_STORAGE_CONCURRENCY: int = 4
     REDIS_HOST: str = "redis"
     REDIS_PORT: int = 6379
+    JOB_QUEUE_ENABLED: bool = True
+    JOB_LEASE_SECONDS: int = 60
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_RETRY_BASE_SECONDS: int = 5
+    JOB_RETRY_MAX_SECONDS: int = 300
+    JOB_RESULT_TTL_SECONDS: int = 86400
+    JOB_LANES: str = "recheck,draft"  # highest priority first
+    JOB_DEFAULT_LANE: str = "draft"
+    JOB_MAX_RUNNING_PER_STUDENT: int = 2  # 0 = no cap
+    JOB_DURATION_SAMPLES: int = 200
+    ADMISSION_CONTROL_ENABLED: bool = True
+    ADMISSION_MAX_PENDING: int = 500
+    ADMISSION_MAX_WAIT_SECONDS: int = 900  # queue wait only; upload to result is at most this + ANALYSIS_DEADLINE_SECONDS
+    ADMISSION_MAX_PER_STUDENT: int = 10
+    ADMISSION_TARGET_WAIT_SECONDS: int = 120  # autoscaling target for queue wait
+    ADMISSION_DEFAULT_JOB_SECONDS: float = 30.0  # until real durations are recorded
+    ADMISSION_SNAPSHOT_SECONDS: float = 1.0
+    WORKER_CONCURRENCY: int = 4
+    WORKER_POLL_INTERVAL_SECONDS: float = 1.0
+    UPLOAD_DIR: str = "/uploads"
+    BLOB_GC_INTERVAL_SECONDS: int = 3600
+    BLOB_GC_GRACE_SECONDS: int = 86400
+    RESUBMISSION_REUSE_ENABLED: bool = True
+    NEAR_DUPLICATE_MAX_HAMMING: int = 3
+    RESUBMISSION_LOOKBACK: int = 50
+    INCREMENTAL_REANALYSIS_ENABLED: bool = True
+    REVISION_MAX_HAMMING: int = 20
+    INCREMENTAL_MAX_CHANGED_RATIO: float = 0.5
+    PDF_EXTRACTION_WORKERS: int = 0  # 0 = one process per CPU core
+    PDF_PARALLEL_MIN_PAGES: int = 16
+    STREAMING_UPLOAD_MIN_BYTES: int = 5 * 1024 * 1024
+    STREAM_EMBED_BATCH_SIZE: int = 16
+    STREAM_PAGE_CHARS: int = 64 * 1024
 
     class Config:
         env_file = ".env"
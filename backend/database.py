@@ -1,17 +1,84 @@
-from sqlalchemy import create_engine
+import time
+from typing import Iterable
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from config import settings
+from metrics import metrics, Sample
 
 DATABASE_URL = f"postgresql://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}@{settings.POSTGRES_HOST}/{settings.POSTGRES_DB}"
 
-engine = create_engine(DATABASE_URL)
+def _pool_options() -> dict:
+    return {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        # Drops connections killed by a Postgres restart instead of failing the request
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "query_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+    }
+
+engine = create_engine(DATABASE_URL, **_pool_options())
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Optional asyncpg engine for async handlers, so they stop blocking the event loop
+async_engine = None
+AsyncSessionLocal = None
+if settings.DB_ASYNC_ENABLED:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    ASYNC_DATABASE_URL = (
+        f"postgresql+asyncpg://{settings.POSTGRES_USER}:{settings.POSTGRES_PASSWORD}@{settings.POSTGRES_HOST}/{settings.POSTGRES_DB}"
+        f"?prepared_statement_cache_size={settings.DB_STATEMENT_CACHE_SIZE}"
+    )
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **_pool_options())
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def _instrument(pool, name: str):
+    @event.listens_for(pool, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        metrics.inc("db_pool_connects_total", engine=name)
+
+    @event.listens_for(pool, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checked_out_at"] = time.monotonic()
+
+    @event.listens_for(pool, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        started = connection_record.info.pop("checked_out_at", None)
+        if started is not None:
+            metrics.observe("db_connection_held_seconds", time.monotonic() - started, engine=name)
+
+    @event.listens_for(pool, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.inc("db_pool_invalidated_total", engine=name)
+
+_pools = {"sync": engine.pool}
+if async_engine is not None:
+    _pools["async"] = async_engine.sync_engine.pool
+for _name, _pool in _pools.items():
+    _instrument(_pool, _name)
+
+def _pool_samples() -> Iterable[Sample]:
+    for name, pool in _pools.items():
+        yield "db_pool_size", {"engine": name}, pool.size()
+        yield "db_pool_checked_out", {"engine": name}, pool.checkedout()
+        yield "db_pool_checked_in", {"engine": name}, pool.checkedin()
+        yield "db_pool_overflow", {"engine": name}, max(pool.overflow(), 0)
+        yield "db_pool_capacity", {"engine": name}, pool.size() + settings.DB_MAX_OVERFLOW
+
+metrics.register_collector(_pool_samples)
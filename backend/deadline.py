@@ -0,0 +1,49 @@
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+class Deadline:
+    """Wall-clock point by which an analysis should be finished.
+
+    Stored as epoch seconds so it survives the trip through the job queue
+    and across processes.
+    """
+
+    def __init__(self, at: float):
+        self.at = at
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        return cls(time.time() + seconds)
+
+    def remaining(self) -> float:
+        return max(self.at - time.time(), 0.0)
+
+    def expired(self) -> bool:
+        return time.time() >= self.at
+
+_current: contextvars.ContextVar = contextvars.ContextVar("analysis_deadline", default=None)
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]):
+    """Make `deadline` visible to everything called inside the block, e.g. embedding retries"""
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+# How far a result is from a full analysis, per fallback a stage took under budget pressure
+DEGRADATIONS = {
+    "partial_plagiarism": 1,
+    "lexical_retrieval": 2,
+    "cached_llm": 2,
+    "default_llm": 3,
+}
+
+def degradation_level(stages) -> int:
+    return max((DEGRADATIONS.get(stage, 1) for stage in stages), default=0)
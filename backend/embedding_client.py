@@ -0,0 +1,114 @@
+import logging
+import random
+import time
+from typing import List
+
+import google.generativeai as genai
+from google.generativeai.client import get_default_generative_client
+
+from circuit_breaker import CircuitBreaker, register_breaker
+from config import settings
+from deadline import current_deadline
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingUnavailable(Exception):
+    """The embedding provider failed within the call's deadline, or its breaker is open"""
+
+class _TimeoutClient:
+    """Gives each provider request the time left before give_up_at.
+
+    embed_content in this SDK version takes no timeout, but passes requests
+    through whatever client it is given.
+    """
+
+    def __init__(self, give_up_at: float):
+        self._client = get_default_generative_client()
+        self._give_up_at = give_up_at
+
+    def embed_content(self, request):
+        return self._client.embed_content(request, timeout=self._remaining())
+
+    def batch_embed_contents(self, request):
+        return self._client.batch_embed_contents(request, timeout=self._remaining())
+
+    def _remaining(self) -> float:
+        remaining = self._give_up_at - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("embedding call deadline passed")
+        return remaining
+
+class EmbeddingClient:
+    """Gemini embed_content behind a shared circuit breaker.
+
+    Every provider request is bounded by the call's deadline:
+    EMBEDDING_CALL_DEADLINE_SECONDS, or the analysis deadline if that is
+    sooner. Only queued analyses, which run under an analysis deadline,
+    retry failed attempts with full-jitter backoff; request threads make one
+    attempt and fail fast, leaving retries to the job queue. While the
+    breaker is open calls raise EmbeddingUnavailable at once, without
+    touching the provider.
+    """
+
+    def __init__(self, model: str, redis_client=None):
+        self.model = model
+        self.breaker = register_breaker(CircuitBreaker(
+            "embeddings",
+            self._probe,
+            redis_client,
+            failure_threshold=settings.EMBEDDING_BREAKER_FAILURE_THRESHOLD,
+            window_seconds=settings.EMBEDDING_BREAKER_WINDOW_SECONDS,
+            open_seconds=settings.EMBEDDING_BREAKER_OPEN_SECONDS,
+            probe_interval=settings.EMBEDDING_BREAKER_PROBE_INTERVAL_SECONDS
+        ))
+
+    def available(self) -> bool:
+        return self.breaker.allow()
+
+    def embed(self, contents: List[str]) -> List[List[float]]:
+        if not self.breaker.allow():
+            metrics.inc("embedding_requests_total", result="short_circuited")
+            raise EmbeddingUnavailable("embedding circuit breaker is open")
+
+        give_up_at = time.monotonic() + settings.EMBEDDING_CALL_DEADLINE_SECONDS
+        analysis_deadline = current_deadline()
+        if analysis_deadline is not None:
+            give_up_at = min(give_up_at, time.monotonic() + analysis_deadline.remaining())
+
+        attempts = settings.EMBEDDING_MAX_ATTEMPTS if analysis_deadline is not None else 1
+
+        last_error = None
+        for attempt in range(attempts):
+            started = time.monotonic()
+            try:
+                result = genai.embed_content(
+                    model=self.model, content=contents, task_type="retrieval_document", client=_TimeoutClient(give_up_at)
+                )
+            except Exception as e:
+                last_error = e
+                self.breaker.record_failure()
+                metrics.inc("embedding_requests_total", result="error")
+                logger.warning(f"Embedding attempt {attempt + 1} failed: {e}")
+            else:
+                self.breaker.record_success()
+                metrics.inc("embedding_requests_total", result="ok")
+                metrics.observe("embedding_request_seconds", time.monotonic() - started)
+                return result["embedding"]
+
+            if attempt == attempts - 1 or not self.breaker.allow():
+                break
+            backoff = random.uniform(0, min(settings.EMBEDDING_RETRY_MAX_SECONDS, settings.EMBEDDING_RETRY_BASE_SECONDS * 2 ** attempt))
+            if time.monotonic() + backoff >= give_up_at:
+                break
+            time.sleep(backoff)
+
+        raise EmbeddingUnavailable(f"embedding failed: {last_error}")
+
+    def _probe(self):
+        genai.embed_content(
+            model=self.model,
+            content="health check",
+            task_type="retrieval_document",
+            client=_TimeoutClient(time.monotonic() + settings.EMBEDDING_CALL_DEADLINE_SECONDS)
+        )
@@ -1,34 +1,147 @@
 from PyPDF2 import PdfReader
 from docx import Document
+from concurrent.futures import ProcessPoolExecutor
 import os
-from typing import Tuple
+import threading
+from typing import Tuple, List, Dict, Iterable, Iterator, Optional
+from config import settings
+
+_pdf_executor: Optional[ProcessPoolExecutor] = None
+_pdf_executor_lock = threading.Lock()
+
+def _get_pdf_executor() -> ProcessPoolExecutor:
+    """Lazily create the process pool shared by all PDF extractions"""
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is None:
+            _pdf_executor = ProcessPoolExecutor(max_workers=_pdf_worker_count())
+        return _pdf_executor
+
+def _pdf_worker_count() -> int:
+    return settings.PDF_EXTRACTION_WORKERS or os.cpu_count() or 1
+
+def _extract_page_range(file_path: str, start: int, end: int) -> List[str]:
+    """Extract pages [start, end) in a worker process; each worker opens its own reader"""
+    reader = PdfReader(file_path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
 
 class FileProcessor:
     @staticmethod
     def extract_text(file_path: str, filename: str) -> Tuple[str, int]:
+        text, word_count, _ = FileProcessor.extract_pages(file_path, filename)
+        return text, word_count
+
+    @staticmethod
+    def extract_pages(file_path: str, filename: str) -> Tuple[str, int, List[Dict[str, int]]]:
+        """Extract text plus page boundaries ({page, start, end} char offsets into the text)"""
         file_extension = os.path.splitext(filename)[1].lower()
 
         if file_extension == '.pdf':
             return FileProcessor._extract_from_pdf(file_path)
         elif file_extension in ['.docx', '.doc']:
-            return FileProcessor._extract_from_docx(file_path)
+            return FileProcessor._single_page(*FileProcessor._extract_from_docx(file_path))
         elif file_extension == '.txt':
-            return FileProcessor._extract_from_txt(file_path)
+            return FileProcessor._single_page(*FileProcessor._extract_from_txt(file_path))
         else:
             raise ValueError(f"Unsupported file format: {file_extension}")
 
     @staticmethod
-    def _extract_from_pdf(file_path: str) -> Tuple[str, int]:
+    def iter_pages(file_path: str, filename: str) -> Iterator[str]:
+        """Yield the document one page at a time for the streaming upload path.
+
+        PDFs yield real pages; DOCX and TXT are cut into blocks of roughly
+        STREAM_PAGE_CHARS at paragraph/line boundaries, which are not pages
+        and must not be cited as page numbers.
+        """
+        file_extension = os.path.splitext(filename)[1].lower()
+
         try:
-            reader = PdfReader(file_path)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text()
-            word_count = len(text.split())
-            return text.strip(), word_count
+            if file_extension == '.pdf':
+                reader = PdfReader(file_path)
+                for page in reader.pages:
+                    yield page.extract_text() or ""
+            elif file_extension in ['.docx', '.doc']:
+                doc = Document(file_path)
+                yield from FileProcessor._group_lines(p.text for p in doc.paragraphs)
+            elif file_extension == '.txt':
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    yield from FileProcessor._group_lines(f)
+            else:
+                raise ValueError(f"Unsupported file format: {file_extension}")
+        except ValueError:
+            raise
+        except Exception as e:
+            raise Exception(f"Error streaming text from {file_extension.lstrip('.').upper()}: {str(e)}")
+
+    @staticmethod
+    def _group_lines(lines: Iterable[str]) -> Iterator[str]:
+        block: List[str] = []
+        size = 0
+        for line in lines:
+            block.append(line.rstrip("\n"))
+            size += len(line)
+            if size >= settings.STREAM_PAGE_CHARS:
+                yield "\n".join(block)
+                block = []
+                size = 0
+        if block:
+            yield "\n".join(block)
+
+    @staticmethod
+    def page_for_offset(page_map: Optional[List[Dict[str, int]]], offset: int) -> Optional[int]:
+        """Return the 1-based page number containing a character offset"""
+        if not page_map:
+            return None
+        lo, hi = 0, len(page_map) - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if page_map[mid]["start"] <= offset:
+                lo = mid
+            else:
+                hi = mid - 1
+        return page_map[lo]["page"]
+
+    @staticmethod
+    def _single_page(text: str, word_count: int) -> Tuple[str, int, List[Dict[str, int]]]:
+        return text, word_count, [{"page": 1, "start": 0, "end": len(text)}]
+
+    @staticmethod
+    def _extract_from_pdf(file_path: str) -> Tuple[str, int, List[Dict[str, int]]]:
+        try:
+            page_count = len(PdfReader(file_path).pages)
+            workers = min(_pdf_worker_count(), page_count)
+
+            if workers > 1 and page_count >= settings.PDF_PARALLEL_MIN_PAGES:
+                step = -(-page_count // workers)
+                ranges = [(i, min(i + step, page_count)) for i in range(0, page_count, step)]
+                executor = _get_pdf_executor()
+                futures = [executor.submit(_extract_page_range, file_path, s, e) for s, e in ranges]
+                pages = [page for future in futures for page in future.result()]
+            else:
+                pages = _extract_page_range(file_path, 0, page_count)
+
+            return FileProcessor._join_pages(pages)
         except Exception as e:
             raise Exception(f"Error extracting text from PDF: {str(e)}")
 
+    @staticmethod
+    def _join_pages(pages: List[str]) -> Tuple[str, int, List[Dict[str, int]]]:
+        """Join pages once and record where each one starts and ends in the stripped text"""
+        raw = "\n".join(pages)
+        text = raw.strip()
+        shift = len(raw) - len(raw.lstrip())
+
+        page_map = []
+        offset = 0
+        for number, page in enumerate(pages, start=1):
+            start = min(max(offset - shift, 0), len(text))
+            end = min(max(offset + len(page) - shift, 0), len(text))
+            page_map.append({"page": number, "start": start, "end": end})
+            offset += len(page) + 1
+
+        word_count = len(text.split())
+        return text, word_count, page_map
+
     @staticmethod
     def _extract_from_docx(file_path: str) -> Tuple[str, int]:
         try:
@@ -0,0 +1,91 @@
+import hashlib
+import zlib
+from typing import List
+
+import numpy as np
+
+SHINGLE_SIZE = 3
+_MASK_64 = (1 << 64) - 1
+
+class SimHasher:
+    """Incremental 64-bit SimHash over lower-cased word trigrams.
+
+    Feeding the words in several update() calls gives the same sketch as
+    feeding them at once, so streamed uploads can be sketched chunk by chunk.
+    """
+
+    def __init__(self):
+        self.counts = np.zeros(64, dtype=np.int64)
+        self._tail: List[str] = []
+
+    def update(self, words: List[str]):
+        words = self._tail + [w.lower() for w in words]
+        shingles = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+        self._tail = words[-(SHINGLE_SIZE - 1):]
+        if not shingles:
+            return
+
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles)
+        )
+        bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+        self.counts += 2 * bits.sum(axis=0, dtype=np.int64) - len(shingles)
+
+    def digest(self) -> int:
+        """Sketch as a signed 64-bit int so it fits a BIGINT column"""
+        value = 0
+        for bit in np.flatnonzero(self.counts > 0):
+            value |= 1 << int(bit)
+        return value - (1 << 64) if value >= 1 << 63 else value
+
+def sketch_text(text: str) -> int:
+    hasher = SimHasher()
+    hasher.update(text.split())
+    return hasher.digest()
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin((a ^ b) & _MASK_64).count("1")
+
+def chunk_hash(chunk: str) -> str:
+    """Content hash used to key persisted chunk embeddings and flags"""
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+class WordChunker:
+    """Content-defined chunk boundaries over a word stream.
+
+    A gear hash of the last few words decides where a chunk ends, so
+    boundaries move with the text instead of sitting every N words:
+    inserting or deleting a word changes only the chunk it falls in and,
+    at most, its neighbour. Chunks are avg_words/2 to 2*avg_words long and
+    average about avg_words.
+    """
+
+    def __init__(self, avg_words: int = 500):
+        self.min_words = avg_words // 2
+        self.max_words = avg_words * 2
+        self.mask = (1 << (avg_words - self.min_words).bit_length()) - 1
+        self.reset()
+
+    def reset(self):
+        self._hash = 0
+        self._count = 0
+
+    def boundary_after(self, word: str) -> bool:
+        """Feed one word; True if the current chunk ends with it"""
+        self._hash = ((self._hash << 1) + zlib.crc32(word.encode("utf-8"))) & _MASK_64
+        self._count += 1
+        if self._count >= self.max_words or (self._count >= self.min_words and self._hash & self.mask == 0):
+            self.reset()
+            return True
+        return False
+
+def chunk_starts(words: List[str], avg_words: int = 500) -> List[int]:
+    """Index of the first word of each chunk"""
+    chunker = WordChunker(avg_words)
+    starts = [0]
+    for i, word in enumerate(words):
+        if chunker.boundary_after(word) and i + 1 < len(words):
+            starts.append(i + 1)
+    return starts
@@ -0,0 +1,62 @@
+import threading
+from typing import Dict, Iterable
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import settings
+from metrics import metrics, Sample
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+def http_session(name: str) -> requests.Session:
+    """Long-lived, keep-alive session shared by every caller of one upstream.
+
+    Each host gets its own urllib3 pool of HTTP_POOL_MAXSIZE connections;
+    with HTTP_POOL_BLOCK callers wait for a free connection instead of
+    opening extra ones, which caps connections per host.
+    """
+    with _sessions_lock:
+        session = _sessions.get(name)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=settings.HTTP_POOL_CONNECTIONS,
+                pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+                pool_block=settings.HTTP_POOL_BLOCK
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.hooks["response"].append(_latency_hook(name))
+            _sessions[name] = session
+        return session
+
+def _latency_hook(name: str):
+    def record(response, *args, **kwargs):
+        metrics.observe(
+            "http_client_request_seconds",
+            response.elapsed.total_seconds(),
+            client=name,
+            status=response.status_code
+        )
+    return record
+
+def _pool_samples() -> Iterable[Sample]:
+    """Per-host connection pool occupancy for every shared session"""
+    with _sessions_lock:
+        sessions = list(_sessions.items())
+    for name, session in sessions:
+        adapter = session.get_adapter("https://")
+        for key in list(adapter.poolmanager.pools.keys()):
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            labels = {"client": name, "host": f"{pool.host}:{pool.port}"}
+            idle_slots = pool.pool.qsize() if pool.pool is not None else 0
+            yield "http_client_pool_in_use", labels, settings.HTTP_POOL_MAXSIZE - idle_slots
+            yield "http_client_pool_size", labels, settings.HTTP_POOL_MAXSIZE
+            yield "http_client_connections_opened_total", labels, pool.num_connections
+            yield "http_client_requests_total", labels, pool.num_requests
+
+metrics.register_collector(_pool_samples)
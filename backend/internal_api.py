@@ -0,0 +1,183 @@
+import hmac
+from typing import List, Optional, Union
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from analysis_pipeline import build_job_payload
+from analysis_store import upsert_analysis_results
+from blob_store import blob_store
+from claim_check import verify_text_signature
+from config import settings
+from database import get_db
+from deadline import Deadline, degradation_level
+from job_queue import job_queue
+from llm_gateway import llm_gateway, template_scope
+from models import Assignment, AssignmentChunk, Student
+from notifications import publish_status
+from rag_service import rag_service
+from schemas import LLMGenerateRequest, RetrievalRequest, AcademicSourceResponse, AnalysisResponse, AnalysisIngestResponse
+
+# Endpoints called by n8n and other backend services rather than by students
+router = APIRouter(prefix="/internal", tags=["internal"])
+
+def require_internal_token(x_internal_token: Optional[str] = Header(None)):
+    """Shared-secret check for service-to-service calls"""
+    if not settings.INTERNAL_API_TOKEN or not x_internal_token or not hmac.compare_digest(
+        x_internal_token, settings.INTERNAL_API_TOKEN
+    ):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid internal token")
+
+@router.get("/assignments/{assignment_id}/text")
+def get_assignment_text_slice(
+    assignment_id: int,
+    expires: int,
+    sig: str,
+    start: int = Query(0, ge=0),
+    length: int = Query(None, ge=1),
+    chunk: int = Query(None, ge=0),
+    db: Session = Depends(get_db)
+):
+    """Claim-check endpoint: return one slice of an assignment's text.
+
+    Slices are character ranges of original_text, or whole chunks by index
+    for streamed uploads, so callers never need the full document at once.
+    """
+    if not verify_text_signature(assignment_id, expires, sig):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid or expired signature")
+
+    length = min(length or settings.CLAIM_CHECK_MAX_SLICE_CHARS, settings.CLAIM_CHECK_MAX_SLICE_CHARS)
+
+    if chunk is not None:
+        content = db.query(AssignmentChunk.content).filter(
+            AssignmentChunk.assignment_id == assignment_id,
+            AssignmentChunk.chunk_index == chunk
+        ).scalar()
+        if content is None:
+            raise HTTPException(status_code=404, detail="Chunk not found")
+        return {"assignment_id": assignment_id, "chunk": chunk, "text": content}
+
+    row = db.query(
+        func.substr(Assignment.original_text, start + 1, length),
+        func.length(Assignment.original_text)
+    ).filter(Assignment.id == assignment_id).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+
+    text_slice, total_length = row
+    return {
+        "assignment_id": assignment_id,
+        "start": start,
+        "text": text_slice or "",
+        "total_length": total_length or 0,
+        "has_more": start + length < (total_length or 0)
+    }
+
+@router.post("/assignments/{assignment_id}/recheck", dependencies=[Depends(require_internal_token)])
+def recheck_assignment(assignment_id: int, db: Session = Depends(get_db)):
+    """Re-run an assignment's analysis in the highest-priority lane, ahead of student drafts"""
+    assignment = db.query(Assignment).filter(Assignment.id == assignment_id).first()
+    if not assignment:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+    if job_queue is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Job queue unavailable")
+
+    student = db.query(Student).filter(Student.id == assignment.student_id).first()
+    streamed = assignment.original_text is None
+    if streamed:
+        first_chunk = db.query(AssignmentChunk.content).filter(
+            AssignmentChunk.assignment_id == assignment_id,
+            AssignmentChunk.chunk_index == 0
+        ).scalar() or ""
+        text = " ".join(first_chunk.split()[:100])
+    else:
+        text = assignment.original_text
+    file_path = blob_store.path_for(assignment.content_digest) if assignment.content_digest else None
+
+    lane = job_queue.lanes[0]
+    job_id = job_queue.enqueue(
+        build_job_payload(assignment, student, text, file_path, streamed),
+        student_id=assignment.student_id,
+        lane=lane
+    )
+    publish_status(assignment_id, "queued", job_id=job_id, lane=lane)
+    return {"assignment_id": assignment_id, "job_id": job_id, "lane": lane}
+
+@router.post(
+    "/retrieval",
+    response_model=List[AcademicSourceResponse],
+    dependencies=[Depends(require_internal_token)]
+)
+def retrieve_sources_for_assignment(
+    retrieval_request: RetrievalRequest,
+    db: Session = Depends(get_db)
+):
+    """Top academic sources for an assignment, used by the workflow's source search step"""
+    exists = db.query(Assignment.id).filter(Assignment.id == retrieval_request.assignment_id).first()
+    if not exists:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+
+    sources = rag_service.search_sources_for_assignment(
+        db,
+        retrieval_request.assignment_id,
+        retrieval_request.limit
+    )
+    return [AcademicSourceResponse(**source) for source in sources]
+
+@router.post("/llm/generate", dependencies=[Depends(require_internal_token)])
+def generate_content(generate_request: LLMGenerateRequest):
+    """Cached generateContent for the workflow, answering in Gemini's response shape.
+
+    With a deadline_at close enough, only a cached answer is used; when there
+    is none, or a call fails with too little time left to try again, the
+    candidates are empty and the workflow uses its defaults. Any other
+    failure is a 502 so the analysis fails and is retried.
+    """
+    deadline = Deadline(generate_request.deadline_at) if generate_request.deadline_at else None
+    cache_only = deadline is not None and deadline.remaining() < settings.DEADLINE_LLM_MIN_SECONDS
+    response_text, cache_type = llm_gateway.generate(
+        generate_request.prompt,
+        generate_request.model,
+        cache_only=cache_only,
+        timeout=deadline.remaining() if deadline is not None and not cache_only else None,
+        semantic_text=generate_request.semantic_text,
+        scope=template_scope(
+            generate_request.topic, generate_request.academic_level, generate_request.source_titles
+        ) if generate_request.topic else None
+    )
+    out_of_time = deadline is not None and (cache_only or deadline.remaining() < settings.DEADLINE_LLM_MIN_SECONDS)
+    if not response_text and not out_of_time:
+        raise HTTPException(status_code=status.HTTP_502_BAD_GATEWAY, detail="LLM call failed")
+
+    degraded = []
+    if not response_text:
+        degraded.append("default_llm")
+    elif cache_only:
+        degraded.append("cached_llm")
+    return {
+        "candidates": [{"content": {"parts": [{"text": response_text}]}}] if response_text else [],
+        "cached": cache_type,
+        "degradation_level": degradation_level(degraded),
+        "degraded_stages": degraded
+    }
+
+@router.post(
+    "/analysis-results",
+    response_model=AnalysisIngestResponse,
+    dependencies=[Depends(require_internal_token)]
+)
+def ingest_analysis_results(
+    results: Union[AnalysisResponse, List[AnalysisResponse]],
+    db: Session = Depends(get_db)
+):
+    """Store one or many finished analyses, upserting by assignment_id in a single transaction"""
+    if not isinstance(results, list):
+        results = [results]
+
+    stored, missing = upsert_analysis_results(db, [result.model_dump() for result in results])
+    return {
+        "stored": len(stored),
+        "assignment_ids": stored,
+        "missing_assignment_ids": missing
+    }
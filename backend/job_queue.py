@@ -0,0 +1,331 @@
+import json
+import logging
+import random
+import time
+import uuid
+from typing import Any, Dict, Optional, Tuple
+
+import redis
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Shared by every script: put a job at the back (or, for recovered leases, the
+# front) of its student's queue in its lane, and give the student a place in
+# the lane's round-robin ring if they are not already in it. Jobs queued before
+# lanes existed carry neither field; they go to the default lane as anonymous
+# ('_', JobQueue.ANONYMOUS) rather than failing after they were taken off a list.
+_PUSH = """
+local function push(prefix, lanes_prefix, counts, id, front, default_lane)
+    local lane = redis.call('HGET', prefix .. id, 'lane')
+    local student = redis.call('HGET', prefix .. id, 'student')
+    if not lane then
+        lane = default_lane
+        redis.call('HSET', prefix .. id, 'lane', lane)
+    end
+    if not student then
+        student = '_'
+        redis.call('HSET', prefix .. id, 'student', student)
+    end
+    local queue = lanes_prefix .. lane .. ':q:' .. student
+    if front then
+        redis.call('RPUSH', queue, id)
+    else
+        redis.call('LPUSH', queue, id)
+    end
+    local ring = lanes_prefix .. lane .. ':ring'
+    if not redis.call('LPOS', ring, student) then
+        redis.call('LPUSH', ring, student)
+    end
+    redis.call('HINCRBY', counts, lane, 1)
+end
+
+local function release(prefix, running, id)
+    local student = redis.call('HGET', prefix .. id, 'student')
+    if student and tonumber(redis.call('HINCRBY', running, student, -1)) <= 0 then
+        redis.call('HDEL', running, student)
+    end
+end
+"""
+
+_ENQUEUE = _PUSH + """
+redis.call('HSET', ARGV[1] .. ARGV[3], 'payload', ARGV[4], 'status', 'queued', 'attempts', 0,
+    'enqueued_at', ARGV[5], 'lane', ARGV[6], 'student', ARGV[7])
+push(ARGV[1], ARGV[2], KEYS[1], ARGV[3], false, ARGV[6])
+return 1
+"""
+
+# Promote due retries, recover jobs whose lease expired, then pick the next job:
+# lanes in priority order, students within a lane in round-robin order,
+# skipping students already at their concurrency cap.
+# Everything happens in one script so any number of workers can claim safely.
+_CLAIM = _PUSH + """
+local leases, delayed, dead, running, counts = KEYS[1], KEYS[2], KEYS[3], KEYS[4], KEYS[5]
+local now, lease, worker, prefix, max_attempts = tonumber(ARGV[1]), tonumber(ARGV[2]), ARGV[3], ARGV[4], tonumber(ARGV[5])
+local lanes_prefix, cap, default_lane = ARGV[6], tonumber(ARGV[7]), ARGV[8]
+
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', delayed, '-inf', now, 'LIMIT', 0, 100)) do
+    redis.call('ZREM', delayed, id)
+    redis.call('HSET', prefix .. id, 'status', 'queued')
+    push(prefix, lanes_prefix, counts, id, false, default_lane)
+end
+
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', leases, '-inf', now, 'LIMIT', 0, 100)) do
+    redis.call('ZREM', leases, id)
+    release(prefix, running, id)
+    if tonumber(redis.call('HGET', prefix .. id, 'attempts') or '0') >= max_attempts then
+        redis.call('HSET', prefix .. id, 'status', 'dead', 'worker', '', 'error', 'lease expired')
+        redis.call('LPUSH', dead, id)
+    else
+        redis.call('HSET', prefix .. id, 'status', 'queued', 'worker', '')
+        push(prefix, lanes_prefix, counts, id, true, default_lane)
+    end
+end
+
+for i = 9, #ARGV do
+    local lane = ARGV[i]
+    local ring = lanes_prefix .. lane .. ':ring'
+    for _ = 1, redis.call('LLEN', ring) do
+        local student = redis.call('RPOPLPUSH', ring, ring)
+        local queue = lanes_prefix .. lane .. ':q:' .. student
+        if redis.call('LLEN', queue) == 0 then
+            redis.call('LREM', ring, 1, student)
+        elseif cap <= 0 or tonumber(redis.call('HGET', running, student) or '0') < cap then
+            local id = redis.call('RPOP', queue)
+            if redis.call('LLEN', queue) == 0 then
+                redis.call('LREM', ring, 1, student)
+            end
+            redis.call('HINCRBY', counts, lane, -1)
+            redis.call('HINCRBY', running, student, 1)
+            redis.call('ZADD', leases, now + lease, id)
+            redis.call('HSET', prefix .. id, 'status', 'running', 'worker', worker, 'claimed_at', now)
+            redis.call('HINCRBY', prefix .. id, 'attempts', 1)
+            return {id, redis.call('HGET', prefix .. id, 'payload')}
+        end
+    end
+end
+return nil
+"""
+
+# Move up to ARGV[4] jobs from the single pending list used before lanes into
+# their lanes, oldest first so they keep their order.
+_MIGRATE = _PUSH + """
+local moved = 0
+for _ = 1, tonumber(ARGV[4]) do
+    local id = redis.call('RPOP', KEYS[1])
+    if not id then
+        break
+    end
+    if redis.call('EXISTS', ARGV[1] .. id) == 1 then
+        push(ARGV[1], ARGV[2], KEYS[2], id, false, ARGV[3])
+        moved = moved + 1
+    end
+end
+return moved
+"""
+
+_HEARTBEAT = """
+if redis.call('HGET', KEYS[2], 'worker') ~= ARGV[1] then
+    return 0
+end
+redis.call('ZADD', KEYS[1], 'XX', ARGV[2], ARGV[3])
+return 1
+"""
+
+_COMPLETE = _PUSH + """
+if redis.call('HGET', KEYS[2], 'worker') ~= ARGV[1] then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[2])
+release(ARGV[5], KEYS[3], ARGV[2])
+redis.call('HSET', KEYS[2], 'status', 'done', 'finished_at', ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+return 1
+"""
+
+_FAIL = _PUSH + """
+local leases, job, delayed, dead, running = KEYS[1], KEYS[2], KEYS[3], KEYS[4], KEYS[5]
+if redis.call('HGET', job, 'worker') ~= ARGV[1] then
+    return false
+end
+redis.call('ZREM', leases, ARGV[2])
+release(ARGV[6], running, ARGV[2])
+redis.call('HSET', job, 'worker', '', 'error', ARGV[3])
+if tonumber(redis.call('HGET', job, 'attempts')) >= tonumber(ARGV[4]) then
+    redis.call('HSET', job, 'status', 'dead')
+    redis.call('LPUSH', dead, ARGV[2])
+    return 'dead'
+end
+redis.call('HSET', job, 'status', 'retrying')
+redis.call('ZADD', delayed, ARGV[5], ARGV[2])
+return 'retrying'
+"""
+
+class JobQueue:
+    """Durable Redis-backed analysis queue with per-student fair scheduling.
+
+    Jobs are hashes at <prefix>:job:<id>. Each lane (JOB_LANES, highest
+    priority first) keeps one FIFO per student and a ring of students with
+    pending work; claims take the highest non-empty lane and rotate through
+    its students, so one student's twenty drafts wait behind everyone else's
+    first. A student never has more than JOB_MAX_RUNNING_PER_STUDENT jobs
+    running at once.
+
+    A claimed job holds a lease in a sorted set that its worker keeps
+    extending with heartbeats; if the worker dies the lease expires and the
+    next claim puts the job back at the front of its student's queue.
+    Failures are retried with jittered exponential backoff until
+    JOB_MAX_ATTEMPTS, after which the job lands on the dead-letter list.
+    """
+
+    ANONYMOUS = "_"
+
+    def __init__(self, redis_client: redis.Redis, prefix: str = "analysis"):
+        self.redis = redis_client
+        self.job_prefix = f"{prefix}:job:"
+        self.legacy_pending_key = f"{prefix}:pending"
+        self.lanes_prefix = f"{prefix}:lane:"
+        self.lane_counts_key = f"{prefix}:lane_depth"
+        self.running_key = f"{prefix}:running"
+        self.leases_key = f"{prefix}:leases"
+        self.delayed_key = f"{prefix}:delayed"
+        self.dead_key = f"{prefix}:dead"
+        self.workers_key = f"{prefix}:workers"
+        self.durations_key = f"{prefix}:durations"
+        self.lanes = [lane.strip() for lane in settings.JOB_LANES.split(",") if lane.strip()]
+        self._enqueue = redis_client.register_script(_ENQUEUE)
+        self._claim = redis_client.register_script(_CLAIM)
+        self._migrate = redis_client.register_script(_MIGRATE)
+        self._heartbeat = redis_client.register_script(_HEARTBEAT)
+        self._complete = redis_client.register_script(_COMPLETE)
+        self._fail = redis_client.register_script(_FAIL)
+
+    def enqueue(self, payload: Dict[str, Any], student_id: Optional[int] = None, lane: Optional[str] = None) -> str:
+        lane = lane or settings.JOB_DEFAULT_LANE
+        if lane not in self.lanes:
+            raise ValueError(f"Unknown job lane {lane!r}; configured lanes: {', '.join(self.lanes)}")
+        job_id = uuid.uuid4().hex
+        self._enqueue(
+            keys=[self.lane_counts_key],
+            args=[
+                self.job_prefix, self.lanes_prefix, job_id, json.dumps(payload), time.time(),
+                lane, self.ANONYMOUS if student_id is None else str(student_id)
+            ]
+        )
+        return job_id
+
+    def claim(self, worker_id: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        result = self._claim(
+            keys=[self.leases_key, self.delayed_key, self.dead_key, self.running_key, self.lane_counts_key],
+            args=[
+                time.time(), settings.JOB_LEASE_SECONDS, worker_id, self.job_prefix, settings.JOB_MAX_ATTEMPTS,
+                self.lanes_prefix, settings.JOB_MAX_RUNNING_PER_STUDENT, settings.JOB_DEFAULT_LANE, *self.lanes
+            ]
+        )
+        if not result:
+            return None
+        job_id, payload = result
+        return job_id, json.loads(payload)
+
+    def migrate_legacy_pending(self, batch: int = 500) -> int:
+        """Drain the pre-lane analysis:pending list into the default lane; returns jobs moved"""
+        moved = 0
+        while True:
+            count = self._migrate(
+                keys=[self.legacy_pending_key, self.lane_counts_key],
+                args=[self.job_prefix, self.lanes_prefix, settings.JOB_DEFAULT_LANE, batch]
+            )
+            moved += count
+            if count < batch and not self.redis.exists(self.legacy_pending_key):
+                return moved
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """Extend the lease; False means the job was reclaimed and the worker should stop"""
+        return bool(self._heartbeat(
+            keys=[self.leases_key, self.job_prefix + job_id],
+            args=[worker_id, time.time() + settings.JOB_LEASE_SECONDS, job_id]
+        ))
+
+    def complete(self, job_id: str, worker_id: str) -> bool:
+        return bool(self._complete(
+            keys=[self.leases_key, self.job_prefix + job_id, self.running_key],
+            args=[worker_id, job_id, time.time(), settings.JOB_RESULT_TTL_SECONDS, self.job_prefix]
+        ))
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> Optional[str]:
+        """Record a failed attempt; returns "retrying", "dead" or None if the lease was lost"""
+        attempts = int(self.redis.hget(self.job_prefix + job_id, "attempts") or 1)
+        backoff = min(settings.JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1), settings.JOB_RETRY_MAX_SECONDS)
+        retry_at = time.time() + random.uniform(backoff / 2, backoff)
+        return self._fail(
+            keys=[self.leases_key, self.job_prefix + job_id, self.delayed_key, self.dead_key, self.running_key],
+            args=[worker_id, job_id, error[:500], settings.JOB_MAX_ATTEMPTS, retry_at, self.job_prefix]
+        )
+
+    def status(self, job_id: str) -> Dict[str, str]:
+        return self.redis.hgetall(self.job_prefix + job_id)
+
+    def student_backlog(self, student_id: int) -> int:
+        """Jobs a student has queued (in any lane) or running"""
+        pipe = self.redis.pipeline(transaction=False)
+        for lane in self.lanes:
+            pipe.llen(f"{self.lanes_prefix}{lane}:q:{student_id}")
+        pipe.hget(self.running_key, str(student_id))
+        *queued, running = pipe.execute()
+        return sum(queued) + max(int(running or 0), 0)
+
+    def worker_seen(self, worker_id: str):
+        """Called by each worker slot on every poll and lease heartbeat so capacity() can count live slots"""
+        self.redis.zadd(self.workers_key, {worker_id: time.time()})
+
+    def record_duration(self, seconds: float):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.lpush(self.durations_key, round(seconds, 3))
+        pipe.ltrim(self.durations_key, 0, settings.JOB_DURATION_SAMPLES - 1)
+        pipe.execute()
+
+    def capacity(self) -> Dict[str, Any]:
+        """Live worker slots and mean job duration over the last JOB_DURATION_SAMPLES jobs"""
+        cutoff = time.time() - max(settings.WORKER_POLL_INTERVAL_SECONDS * 3, settings.JOB_LEASE_SECONDS)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zremrangebyscore(self.workers_key, "-inf", cutoff)
+        pipe.zcard(self.workers_key)
+        pipe.lrange(self.durations_key, 0, -1)
+        _, slots, durations = pipe.execute()
+        durations = [float(d) for d in durations]
+        return {
+            "worker_slots": slots,
+            "avg_job_seconds": sum(durations) / len(durations) if durations else None
+        }
+
+    def depth(self) -> Dict[str, Any]:
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hgetall(self.lane_counts_key)
+        pipe.zcard(self.leases_key)
+        pipe.zcard(self.delayed_key)
+        pipe.llen(self.dead_key)
+        lane_counts, running, delayed, dead = pipe.execute()
+        lanes = {lane: max(int(lane_counts.get(lane, 0)), 0) for lane in self.lanes}
+        return {"pending": sum(lanes.values()), "lanes": lanes, "running": running, "delayed": delayed, "dead": dead}
+
+def _connect() -> Optional[JobQueue]:
+    try:
+        client = redis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            decode_responses=True,
+            socket_connect_timeout=5,
+            socket_timeout=5
+        )
+        client.ping()
+        queue = JobQueue(client)
+        moved = queue.migrate_legacy_pending()
+        if moved:
+            logger.info(f"Moved {moved} jobs from the legacy pending list into lane {settings.JOB_DEFAULT_LANE}")
+        return queue
+    except redis.RedisError as e:
+        logger.error(f"❌ Job queue unavailable, analyses will run inline: {e}")
+        return None
+
+job_queue = _connect() if settings.JOB_QUEUE_ENABLED else None
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import logging
+from typing import Iterable, List, Optional, Tuple
+
+import google.generativeai as genai
+import numpy as np
+
+from config import settings
+from llm_scheduler import MicroBatcher, TokenBucket
+from metrics import metrics, Sample
+from rag_service import rag_service
+
+logger = logging.getLogger(__name__)
+
+CACHE_TYPES = ("exact", "semantic")
+
+def template_scope(topic: Optional[str], academic_level: Optional[str], source_titles: List[Optional[str]]) -> str:
+    """Semantic cache scope: prompts in one scope differ only in the student's own text"""
+    template = json.dumps([topic, academic_level, sorted(title or "" for title in source_titles)])
+    return hashlib.sha256(template.encode("utf-8")).hexdigest()[:32]
+
+class LLMGateway:
+    """Single entry point for generateContent calls from the backend and n8n.
+
+    Responses are cached in Redis by sha256(model + prompt). With the
+    semantic cache enabled, a caller that passes a scope (template_scope:
+    topic, level and source list) and the student-specific part of the prompt
+    (semantic_text) also gets near matches: that text's embedding is compared
+    with earlier answers in the same scope, and the closest is reused when its
+    cosine similarity clears LLM_SEMANTIC_CACHE_THRESHOLD. Only submissions
+    whose prompts share everything but near-identical student text can reuse
+    each other's answer.
+    """
+
+    EXACT_PREFIX = "llm:exact"
+    SEMANTIC_PREFIX = "llm:semantic"
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self.batcher = MicroBatcher(
+            self._invoke_model,
+            TokenBucket(
+                redis_client,
+                "llm:bucket:generate",
+                settings.LLM_REQUESTS_PER_MINUTE,
+                settings.LLM_BURST
+            )
+        )
+
+    def generate(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        cache_only: bool = False,
+        timeout: Optional[float] = None,
+        semantic_text: Optional[str] = None,
+        scope: Optional[str] = None
+    ) -> Tuple[str, Optional[str]]:
+        """Return (response_text, cache_type); cache_type is None for a fresh call.
+
+        With cache_only a miss returns "" instead of calling the model; timeout
+        bounds the wait for a fresh call, including time queued for the batcher.
+        """
+        model = model or settings.GEMINI_ANALYSIS_MODEL
+        key = self._exact_key(model, prompt)
+
+        cached = self._get(key)
+        self._record("exact", cached is not None)
+        if cached is not None:
+            return cached, "exact"
+
+        embedding = None
+        index_key = f"{self.SEMANTIC_PREFIX}:{model}:{scope}"
+        if settings.LLM_SEMANTIC_CACHE_ENABLED and scope and semantic_text:
+            embedding = self._embed(semantic_text)
+            cached = self._semantic_lookup(index_key, embedding)
+            self._record("semantic", cached is not None)
+            if cached is not None:
+                return cached, "semantic"
+
+        if cache_only:
+            return "", None
+
+        response_text = self._call_model(model, prompt, timeout)
+        # Failed calls come back empty; caching them would pin the default analysis
+        if response_text:
+            self._store(key, response_text, index_key, embedding)
+        return response_text, None
+
+    def _call_model(self, model: str, prompt: str, timeout: Optional[float] = None) -> str:
+        timeout = min(timeout, settings.LLM_REQUEST_TIMEOUT_SECONDS) if timeout is not None else settings.LLM_REQUEST_TIMEOUT_SECONDS
+        try:
+            return self.batcher.submit(model, prompt).result(timeout=timeout)
+        except Exception as e:
+            logger.error(f"LLM call to {model} failed: {type(e).__name__}: {e}")
+            metrics.inc("llm_requests_failed_total", model=model)
+            return ""
+
+    def _invoke_model(self, model: str, prompt: str) -> str:
+        return genai.GenerativeModel(model).generate_content(prompt).text
+
+    def _exact_key(self, model: str, prompt: str) -> str:
+        digest = hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()
+        return f"{self.EXACT_PREFIX}:{digest}"
+
+    def _get(self, key: str) -> Optional[str]:
+        if self.redis is None:
+            return None
+        try:
+            return self.redis.get(key)
+        except Exception as e:
+            logger.warning(f"LLM cache read failed: {e}")
+            return None
+
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        # A random fallback vector would pollute the index, so skip semantic reuse instead
+        embedding = rag_service.try_embedding(text)
+        if embedding is None:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _semantic_lookup(self, index_key: str, embedding: Optional[np.ndarray]) -> Optional[str]:
+        """Best cached answer among the scope's most recent LLM_SEMANTIC_CACHE_MAX_ENTRIES prompts"""
+        if self.redis is None or embedding is None:
+            return None
+        try:
+            entries = self.redis.lrange(index_key, 0, settings.LLM_SEMANTIC_CACHE_MAX_ENTRIES - 1)
+        except Exception as e:
+            logger.warning(f"Semantic cache read failed: {e}")
+            return None
+        if not entries:
+            return None
+
+        decoded = [json.loads(entry) for entry in entries]
+        candidates = np.asarray([entry["embedding"] for entry in decoded], dtype=np.float32)
+        scores = candidates @ embedding
+        best = int(np.argmax(scores))
+        if scores[best] < settings.LLM_SEMANTIC_CACHE_THRESHOLD:
+            return None
+        # The index entry outlives its response; an expired key is a miss
+        return self._get(decoded[best]["key"])
+
+    def _store(self, key: str, response_text: str, index_key: str, embedding: Optional[np.ndarray]):
+        if self.redis is None:
+            return
+        try:
+            pipe = self.redis.pipeline()
+            pipe.setex(key, settings.LLM_CACHE_TTL_SECONDS, response_text)
+            if embedding is not None:
+                pipe.lpush(index_key, json.dumps({"key": key, "embedding": embedding.round(5).tolist()}))
+                pipe.ltrim(index_key, 0, settings.LLM_SEMANTIC_CACHE_MAX_ENTRIES - 1)
+                pipe.expire(index_key, settings.LLM_SEMANTIC_CACHE_TTL_SECONDS)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"LLM cache write failed: {e}")
+
+    def _record(self, cache_type: str, hit: bool):
+        metrics.inc("llm_cache_requests_total", cache=cache_type, result="hit" if hit else "miss")
+
+def _hit_ratio_samples() -> Iterable[Sample]:
+    for cache_type in CACHE_TYPES:
+        hits = metrics.counter_value("llm_cache_requests_total", cache=cache_type, result="hit")
+        misses = metrics.counter_value("llm_cache_requests_total", cache=cache_type, result="miss")
+        if hits + misses:
+            yield "llm_cache_hit_ratio", {"cache": cache_type}, hits / (hits + misses)
+
+metrics.register_collector(_hit_ratio_samples)
+
+llm_gateway = LLMGateway(rag_service.redis_client)
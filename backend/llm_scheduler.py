@@ -0,0 +1,142 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+from config import settings
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Refill by elapsed time, then take `requested` tokens if they are there.
+# Returns 0 when granted, otherwise the milliseconds until they will be.
+_TAKE = """
+local rate, capacity, now, requested = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) / 1000 * rate)
+
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait = math.ceil((requested - tokens) / rate * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return wait
+"""
+
+class TokenBucket:
+    """Request budget shared by every backend and worker process through Redis"""
+
+    def __init__(self, redis_client, key: str, per_minute: int, burst: int):
+        self.redis = redis_client
+        self.key = key
+        self.rate = per_minute / 60.0
+        self.capacity = max(1, burst)
+        self._take = redis_client.register_script(_TAKE) if redis_client is not None else None
+
+    def acquire(self, tokens: int = 1):
+        """Block until `tokens` requests fit the budget"""
+        if self._take is None:
+            return
+        tokens = min(tokens, self.capacity)
+        while True:
+            try:
+                wait_ms = int(self._take(
+                    keys=[self.key],
+                    args=[self.rate, self.capacity, int(time.time() * 1000), tokens]
+                ))
+            except Exception as e:
+                # Without Redis there is no shared budget; per-process concurrency still applies
+                logger.warning(f"Token bucket unavailable, dispatching unthrottled: {e}")
+                return
+            if wait_ms <= 0:
+                return
+            metrics.observe("llm_rate_limit_wait_seconds", wait_ms / 1000)
+            time.sleep(wait_ms / 1000)
+
+class MicroBatcher:
+    """Collects LLM prompts for a short window and dispatches them together.
+
+    Identical (model, prompt) pairs in a window share one call. A window
+    takes its tokens from the shared bucket in as few steps as the burst
+    size allows, and its calls then run on a bounded pool, so a burst of
+    uploads becomes a steady stream of requests at the quota rate instead of
+    a spike followed by 429 retries.
+    """
+
+    def __init__(self, call: Callable[[str, str], str], bucket: TokenBucket):
+        self._call = call
+        self._bucket = bucket
+        self._pending: "queue.Queue[Tuple[str, str, Future]]" = queue.Queue()
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.LLM_DISPATCH_CONCURRENCY,
+            thread_name_prefix="llm-dispatch"
+        )
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, model: str, prompt: str) -> Future:
+        self._ensure_started()
+        future: Future = Future()
+        self._pending.put((model, prompt, future))
+        return future
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="llm-batcher", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            batch = [self._pending.get()]
+            deadline = time.monotonic() + settings.LLM_BATCH_WINDOW_MS / 1000
+            while len(batch) < settings.LLM_BATCH_MAX_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._dispatch(batch)
+            except Exception as e:
+                logger.error(f"LLM batch dispatch failed: {e}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _dispatch(self, batch: List[Tuple[str, str, Future]]):
+        groups: Dict[Tuple[str, str], List[Future]] = {}
+        for model, prompt, future in batch:
+            groups.setdefault((model, prompt), []).append(future)
+
+        metrics.observe("llm_batch_size", len(batch))
+        metrics.inc("llm_batched_prompts_total", len(batch))
+        metrics.inc("llm_dispatched_calls_total", len(groups))
+
+        # A window larger than the bucket is released a bucket-full at a time
+        calls = list(groups.items())
+        step = self._bucket.capacity
+        for start in range(0, len(calls), step):
+            window = calls[start:start + step]
+            self._bucket.acquire(len(window))
+            for (model, prompt), futures in window:
+                self._executor.submit(self._run, model, prompt, futures)
+
+    def _run(self, model: str, prompt: str, futures: List[Future]):
+        try:
+            result = self._call(model, prompt)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future in futures:
+            future.set_result(result)
@@ -1,13 +1,17 @@
-from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Form, BackgroundTasks, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session, contains_eager, load_only
+from typing import List, Optional
+import base64
+import json
 import os
-import shutil
-from datetime import timedelta
-import requests
+import asyncio
+from datetime import datetime, timedelta
 
-from database import get_db, engine, Base
+from database import get_db, engine, Base, SessionLocal
 from models import Student, Assignment, AnalysisResult, AcademicSource
 from schemas import (
     StudentRegister,
@@ -16,6 +20,7 @@ from schemas import (
     StudentResponse,
     AssignmentUploadResponse,
     AnalysisResponse,
+    AssignmentListResponse,
     SourceSearchRequest,
     AcademicSourceResponse
 )
@@ -28,11 +33,25 @@ from auth import (
 from config import settings
 from rag_service import rag_service
 from file_processor import file_processor
+from blob_store import blob_store
+from metrics import metrics
+from job_queue import job_queue
+from admission import admission_controller
+from auth_cache import auth_cache
+from analysis_pipeline import dispatch_analysis, build_job_payload
+from internal_api import router as internal_router
+from analysis_store import cache_analysis, cached_analysis
+from notifications import publish_status, status_events, format_sse, last_statuses
+from resubmission import reuse_prior_analysis
+from fingerprints import sketch_text
+from topic_classifier import topic_classifier
 
 Base.metadata.create_all(bind=engine)
 
 app = FastAPI(title="Academic Assignment Helper API", version="1.0.0")
 
+app.include_router(internal_router)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -41,8 +60,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-UPLOAD_DIR = "/uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+
+@app.on_event("startup")
+async def start_blob_gc():
+    asyncio.create_task(_blob_gc_loop())
+
+async def _blob_gc_loop():
+    """Periodically delete upload blobs that no assignment references any more"""
+    while True:
+        await asyncio.sleep(settings.BLOB_GC_INTERVAL_SECONDS)
+        db = SessionLocal()
+        try:
+            await run_in_threadpool(blob_store.collect_garbage, db)
+        except Exception as e:
+            print(f"Blob GC failed: {str(e)}")
+        finally:
+            db.close()
 
 @app.get("/")
 def read_root():
@@ -51,16 +85,16 @@ def read_root():
         "version": "1.0.0",
         "endpoints": {
             "auth": ["/auth/register", "/auth/login"],
-            "assignments": ["/upload", "/analysis/{id}"],
+            "assignments": ["/upload", "/assignments", "/analysis/{id}", "/analysis/{id}/events"],
             "sources": ["/sources"]
         }
     }
 
 @app.post("/auth/register", response_model=StudentResponse)
-def register(student_data: StudentRegister, db: Session = Depends(get_db)):
-    existing_student = db.query(Student).filter(
+async def register(student_data: StudentRegister, db: Session = Depends(get_db)):
+    existing_student = await run_in_threadpool(lambda: db.query(Student).filter(
         (Student.email == student_data.email) | (Student.student_id == student_data.student_id)
-    ).first()
+    ).first())
 
     if existing_student:
         raise HTTPException(
@@ -68,7 +102,7 @@ def register(student_data: StudentRegister, db: Session = Depends(get_db)):
             detail="Email or Student ID already registered"
         )
 
-    hashed_password = get_password_hash(student_data.password)
+    hashed_password = await get_password_hash(student_data.password)
 
     new_student = Student(
         email=student_data.email,
@@ -77,15 +111,20 @@ def register(student_data: StudentRegister, db: Session = Depends(get_db)):
         student_id=student_data.student_id
     )
 
-    db.add(new_student)
-    db.commit()
-    db.refresh(new_student)
+    def save():
+        db.add(new_student)
+        db.commit()
+        db.refresh(new_student)
+
+    await run_in_threadpool(save)
+    # Drop anything cached for a previous account with this email
+    await run_in_threadpool(auth_cache.invalidate_student, new_student.email)
 
     return new_student
 
 @app.post("/auth/login", response_model=Token)
-def login(login_data: StudentLogin, db: Session = Depends(get_db)):
-    student = authenticate_student(db, login_data.email, login_data.password)
+async def login(login_data: StudentLogin, db: Session = Depends(get_db)):
+    student = await authenticate_student(db, login_data.email, login_data.password)
 
     if not student:
         raise HTTPException(
@@ -104,6 +143,7 @@ def login(login_data: StudentLogin, db: Session = Depends(get_db)):
 
 @app.post("/upload", response_model=AssignmentUploadResponse)
 async def upload_assignment(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     current_student: Student = Depends(get_current_student),
     db: Session = Depends(get_db)
@@ -122,97 +162,324 @@ async def upload_assignment(
             detail=f"File type not supported. Allowed: {', '.join(allowed_extensions)}"
         )
 
-    file_path = os.path.join(UPLOAD_DIR, f"{current_student.id}_{file.filename}")
+    # The commits below run in the threadpool; with the default expire_on_commit the
+    # next read of assignment or current_student would reload the row on the event loop
+    db.expire_on_commit = False
 
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+    # Refuse before reading the file when the pipeline cannot take more work
+    estimated_completion = await run_in_threadpool(admission_controller.admit, current_student.id)
 
-    try:
-        text, word_count = file_processor.extract_text(file_path, file.filename)
-    except Exception as e:
-        os.remove(file_path)
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error processing file: {str(e)}"
+    content_digest, file_path, file_size = await run_in_threadpool(blob_store.put, file.file)
+    await run_in_threadpool(blob_store.add_ref, db, content_digest, file_size)
+
+    streamed = file_size >= settings.STREAMING_UPLOAD_MIN_BYTES
+
+    if streamed:
+        # Large documents never exist as one string: pages are chunked and written
+        # to assignment_chunks as they are read (the worker embeds them). Only a preview is kept.
+        assignment = Assignment(
+            student_id=current_student.id,
+            filename=file.filename,
+            content_digest=content_digest
         )
 
-    assignment = Assignment(
-        student_id=current_student.id,
-        filename=file.filename,
-        original_text=text,
-        word_count=word_count
-    )
+        def create():
+            db.add(assignment)
+            db.commit()
+            db.refresh(assignment)
+            # Same bytes were streamed before: copy their chunks instead of re-parsing
+            return db.query(Assignment.id, Assignment.topic, Assignment.academic_level).filter(
+                Assignment.content_digest == content_digest,
+                Assignment.id != assignment.id
+            ).order_by(Assignment.id.desc()).first()
+
+        previous = await run_in_threadpool(create)
+
+        scan = topic_classifier.scanner()
+        try:
+            if previous:
+                stream_stats = await run_in_threadpool(
+                    rag_service.copy_assignment_chunks, db, previous.id, assignment.id
+                )
+            else:
+                stream_stats = await run_in_threadpool(
+                    rag_service.ingest_assignment_stream,
+                    db,
+                    assignment.id,
+                    scan.tap(file_processor.iter_pages(file_path, file.filename)),
+                    paged=file_ext == ".pdf"
+                )
+        except Exception as e:
+            def discard():
+                db.rollback()
+                db.delete(assignment)
+                db.commit()
+                blob_store.release(db, content_digest)
+
+            await run_in_threadpool(discard)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error processing file: {str(e)}"
+            )
+
+        text = stream_stats["preview"]
+        word_count = stream_stats["word_count"]
+        assignment.word_count = word_count
+        assignment.similarity_sketch = stream_stats["sketch"]
+        if previous and previous.topic:
+            classification = {"topic": previous.topic, "academic_level": previous.academic_level}
+        else:
+            classification = scan.result(word_count)
+        assignment.topic = classification["topic"]
+        assignment.academic_level = classification["academic_level"]
+        await run_in_threadpool(db.commit)
+    else:
+        extraction = await run_in_threadpool(blob_store.get_cached_extraction, content_digest)
+        if extraction is None:
+            try:
+                text, word_count, page_map = await run_in_threadpool(
+                    file_processor.extract_pages, file_path, file.filename
+                )
+            except Exception as e:
+                await run_in_threadpool(blob_store.release, db, content_digest)
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail=f"Error processing file: {str(e)}"
+                )
+            similarity_sketch = await run_in_threadpool(sketch_text, text)
+            classification = await run_in_threadpool(topic_classifier.classify, text, word_count)
+            await run_in_threadpool(blob_store.cache_extraction, content_digest, {
+                "text": text,
+                "word_count": word_count,
+                "page_map": page_map,
+                "sketch": similarity_sketch,
+                "classification": classification
+            })
+        else:
+            text, word_count, page_map = extraction["text"], extraction["word_count"], extraction["page_map"]
+            similarity_sketch = extraction.get("sketch")
+            if similarity_sketch is None:
+                similarity_sketch = await run_in_threadpool(sketch_text, text)
+            classification = extraction.get("classification")
+            if classification is None:
+                classification = await run_in_threadpool(topic_classifier.classify, text, word_count)
+
+        assignment = Assignment(
+            student_id=current_student.id,
+            filename=file.filename,
+            original_text=text,
+            word_count=word_count,
+            page_map=page_map,
+            content_digest=content_digest,
+            similarity_sketch=similarity_sketch,
+            topic=classification["topic"],
+            academic_level=classification["academic_level"]
+        )
 
-    db.add(assignment)
-    db.commit()
-    db.refresh(assignment)
-    
-    print(f"[UPLOAD] Assignment uploaded: id={assignment.id}, student_id={current_student.id}")
-    print(f"[UPLOAD] Original text preview: {text[:100]}")  # first 100 chars
+        def save():
+            db.add(assignment)
+            db.commit()
+            db.refresh(assignment)
+            rag_service.record_assignment_chunks(db, assignment.id, text, page_map)
 
-    try:
-        webhook_data = {
+        await run_in_threadpool(save)
+
+    # Resubmissions of the same (or barely edited) file reuse the earlier analysis
+    reused = await run_in_threadpool(reuse_prior_analysis, db, assignment, None if streamed else text)
+    if reused:
+        return {
             "assignment_id": assignment.id,
-            "student_id": current_student.id,
-            "student_email": current_student.email,
-            "filename": file.filename,
-            "file_path": file_path,
-            "text": text,
-            "word_count": word_count
+            "message": f"Resubmission of assignment {reused.reused_from_assignment_id}; previous analysis reused",
+            "status": "completed"
         }
 
-        response = requests.post(
-            settings.N8N_WEBHOOK_URL,
-            json=webhook_data,
-            timeout=10
-        )
-        print("[WEBHOOK] Payload sent to n8n:", webhook_data)
-        print("[WEBHOOK] Response from n8n:", response.status_code, response.text)
+    # A revision of an earlier upload is re-analysed incrementally by the worker
+    webhook_data = build_job_payload(assignment, current_student, text, file_path, streamed, revision_check=True)
 
-        if response.status_code != 200:
-            print(f"n8n webhook warning: {response.status_code}")
+    def enqueue() -> str:
+        if job_queue is None:
+            raise RuntimeError("job queue not configured")
+        job_id = job_queue.enqueue(webhook_data, student_id=current_student.id)
+        publish_status(assignment.id, "queued", job_id=job_id)
+        return job_id
 
+    # Hand the analysis to the worker pool; only run it in-process if Redis is unavailable
+    try:
+        job_id = await run_in_threadpool(enqueue)
+        print(f"[UPLOAD] Analysis job {job_id} queued for assignment {assignment.id}")
     except Exception as e:
-        print(f"Error calling n8n webhook: {str(e)}")
+        print(f"Could not queue analysis job, running in background instead: {str(e)}")
+        await run_in_threadpool(publish_status, assignment.id, "queued")
+        background_tasks.add_task(_run_analysis_inline, webhook_data)
 
     return {
         "assignment_id": assignment.id,
         "message": "Assignment uploaded successfully and analysis started",
-        "status": "processing"
+        "status": "processing",
+        "estimated_completion_seconds": estimated_completion
+    }
+
+def _run_analysis_inline(webhook_data: dict):
+    publish_status(webhook_data["assignment_id"], "running")
+    try:
+        dispatch_analysis(webhook_data)
+    except Exception as e:
+        print(f"Error running analysis: {str(e)}")
+        publish_status(webhook_data["assignment_id"], "failed", error=str(e))
+
+def _encode_cursor(assignment: Assignment) -> str:
+    raw = json.dumps([assignment.uploaded_at.isoformat(), assignment.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        uploaded_at, assignment_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(uploaded_at), int(assignment_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/assignments", response_model=AssignmentListResponse)
+def list_assignments(
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    current_student: Student = Depends(get_current_student),
+    db: Session = Depends(get_db)
+):
+    """The student's assignments, newest first, with their analysis status.
+
+    Keyset pagination over (uploaded_at, id) on idx_assignments_student_uploaded:
+    pass back next_cursor to get the following page. Only summary columns
+    are loaded; the text and the analysis JSONB stay in the database.
+    """
+    query = db.query(Assignment).outerjoin(Assignment.analysis).options(
+        load_only(
+            Assignment.id,
+            Assignment.filename,
+            Assignment.topic,
+            Assignment.academic_level,
+            Assignment.word_count,
+            Assignment.uploaded_at
+        ),
+        contains_eager(Assignment.analysis).load_only(
+            AnalysisResult.id,
+            AnalysisResult.plagiarism_score,
+            AnalysisResult.confidence_score,
+            AnalysisResult.degradation_level,
+            AnalysisResult.analyzed_at
+        )
+    ).filter(Assignment.student_id == current_student.id)
+
+    if cursor:
+        query = query.filter(tuple_(Assignment.uploaded_at, Assignment.id) < _decode_cursor(cursor))
+
+    rows = query.order_by(Assignment.uploaded_at.desc(), Assignment.id.desc()).limit(limit + 1).all()
+    page = rows[:limit]
+
+    # Queued/running/failed live in the status events, not the database
+    statuses = last_statuses([assignment.id for assignment in page if assignment.analysis is None])
+    items = [
+        {
+            "assignment_id": assignment.id,
+            "filename": assignment.filename,
+            "topic": assignment.topic,
+            "academic_level": assignment.academic_level,
+            "word_count": assignment.word_count or 0,
+            "uploaded_at": assignment.uploaded_at,
+            "status": "completed" if assignment.analysis else statuses.get(assignment.id, "processing"),
+            "plagiarism_score": assignment.analysis.plagiarism_score if assignment.analysis else None,
+            "confidence_score": assignment.analysis.confidence_score if assignment.analysis else None,
+            "degradation_level": assignment.analysis.degradation_level if assignment.analysis else None,
+            "analyzed_at": assignment.analysis.analyzed_at if assignment.analysis else None,
+        }
+        for assignment in page
+    ]
+
+    return {
+        "items": items,
+        "next_cursor": _encode_cursor(page[-1]) if len(rows) > limit else None
     }
 
+def _load_analysis(db: Session, assignment_id: int, student_id: int):
+    """(assignment exists, cached result entry or None), from Redis or one joined query"""
+    entry = cached_analysis(assignment_id)
+    if entry is not None and entry["student_id"] == student_id:
+        return True, entry
+
+    row = db.query(Assignment.id, AnalysisResult).outerjoin(
+        AnalysisResult, AnalysisResult.assignment_id == Assignment.id
+    ).filter(
+        Assignment.id == assignment_id,
+        Assignment.student_id == student_id
+    ).first()
+
+    if row is None:
+        return False, None
+    if row.AnalysisResult is None:
+        return True, None
+    return True, cache_analysis(student_id, row.AnalysisResult)
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # If-None-Match uses weak comparison, so W/ prefixes are ignored
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
 @app.get("/analysis/{assignment_id}")
 def get_analysis(
     assignment_id: int,
+    request: Request,
     current_student: Student = Depends(get_current_student),
     db: Session = Depends(get_db)
 ):
-    assignment = db.query(Assignment).filter(
-        Assignment.id == assignment_id,
-        Assignment.student_id == current_student.id
-    ).first()
+    found, entry = _load_analysis(db, assignment_id, current_student.id)
 
-    if not assignment:
+    if not found:
         raise HTTPException(status_code=404, detail="Assignment not found")
 
-    analysis = db.query(AnalysisResult).filter(
-        AnalysisResult.assignment_id == assignment_id
-    ).first()
-
-    if not analysis:
+    if entry is None:
         raise HTTPException(status_code=404, detail="Analysis not ready")
 
-    # Simple dictionary return - no Pydantic model
-    return {
-        "assignment_id": analysis.assignment_id,
-        "plagiarism_score": float(analysis.plagiarism_score) if analysis.plagiarism_score else 0.0,
-        "confidence_score": float(analysis.confidence_score) if analysis.confidence_score else 0.0,
-        "research_suggestions": analysis.research_suggestions or "No suggestions available",
-        "citation_recommendations": analysis.citation_recommendations or "Use APA format",
-        "suggested_sources": analysis.suggested_sources or [],
-        "flagged_sections": analysis.flagged_sections or [],
-        "analyzed_at": analysis.analyzed_at.isoformat() if analysis.analyzed_at else None
+    headers = {
+        "ETag": entry["etag"],
+        # Private to the student; a re-check can replace the result, so always revalidate
+        "Cache-Control": f"private, max-age={settings.ANALYSIS_CACHE_MAX_AGE_SECONDS}, must-revalidate"
     }
+    if _etag_matches(request.headers.get("if-none-match"), entry["etag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    return JSONResponse(entry["payload"], headers=headers)
+
+@app.get("/analysis/{assignment_id}/events")
+async def stream_analysis_events(
+    assignment_id: int,
+    current_student: Student = Depends(get_current_student),
+    db: Session = Depends(get_db)
+):
+    """Server-sent events for an assignment's analysis: queued, running, retrying, then completed or failed.
+
+    The completed event carries the same result as GET /analysis/{id}, so
+    clients subscribe once instead of polling.
+    """
+    found, entry = await run_in_threadpool(_load_analysis, db, assignment_id, current_student.id)
+
+    if not found:
+        raise HTTPException(status_code=404, detail="Assignment not found")
+
+    finished = entry["payload"] if entry else None
+
+    async def event_stream():
+        if finished is not None:
+            yield format_sse({"assignment_id": assignment_id, "status": "completed", "result": finished})
+            return
+        async for event in status_events(assignment_id):
+            yield format_sse(event)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.post("/sources", response_model=List[AcademicSourceResponse])
 def search_sources(
@@ -239,6 +506,10 @@ def search_sources(
         for source in sources
     ]
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return metrics.render()
+
 @app.get("/health")
 def health_check():
     return {"status": "healthy", "service": "academic-assignment-helper"}
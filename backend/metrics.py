@@ -0,0 +1,76 @@
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Tuple
+
+Labels = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, Dict[str, str], float]
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format(name: str, labels: Labels, value: float) -> str:
+    if labels:
+        rendered = ",".join(f'{key}="{val}"' for key, val in labels)
+        return f"{name}{{{rendered}}} {value}"
+    return f"{name} {value}"
+
+class Metrics:
+    """Minimal in-process metrics registry rendered in Prometheus text format.
+
+    Counters and gauges are plain values; observe() keeps count/sum/max per
+    label set. Collectors are called at scrape time for values that are
+    cheaper to read on demand, such as connection pool occupancy.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = defaultdict(lambda: defaultdict(float))
+        self._gauges: Dict[str, Dict[Labels, float]] = defaultdict(dict)
+        self._summaries: Dict[str, Dict[Labels, List[float]]] = defaultdict(dict)
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            self._counters[name][_labels(labels)] += value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[name][_labels(labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _labels(labels)
+        with self._lock:
+            summary = self._summaries[name].setdefault(key, [0, 0.0, 0.0])
+            summary[0] += 1
+            summary[1] += value
+            summary[2] = max(summary[2], value)
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]):
+        self._collectors.append(collector)
+
+    def counter_value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters[name].get(_labels(labels), 0.0)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in self._counters.items():
+                lines.append(f"# TYPE {name} counter")
+                lines.extend(_format(name, labels, value) for labels, value in series.items())
+            for name, series in self._gauges.items():
+                lines.append(f"# TYPE {name} gauge")
+                lines.extend(_format(name, labels, value) for labels, value in series.items())
+            for name, series in self._summaries.items():
+                lines.append(f"# TYPE {name} summary")
+                for labels, (count, total, maximum) in series.items():
+                    lines.append(_format(f"{name}_count", labels, count))
+                    lines.append(_format(f"{name}_sum", labels, total))
+                    lines.append(_format(f"{name}_max", labels, maximum))
+
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                lines.append(_format(name, _labels(labels), value))
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
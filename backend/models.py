@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Float, ForeignKey, DateTime, func
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Float, ForeignKey, DateTime, Index, func
 from sqlalchemy.dialects.postgresql import JSONB
 from pgvector.sqlalchemy import Vector
 from sqlalchemy.orm import relationship
@@ -27,22 +27,55 @@ class Assignment(Base):
     topic = Column(String)
     academic_level = Column(String)
     word_count = Column(Integer, default=0)
+    page_map = Column(JSONB)
+    content_digest = Column(String(64), index=True)
+    similarity_sketch = Column(BigInteger)
     uploaded_at = Column(DateTime, default=datetime.utcnow)
 
     student = relationship("Student", back_populates="assignments")
     analysis = relationship("AnalysisResult", back_populates="assignment", uselist=False)
 
+    __table_args__ = (
+        # Keyset pagination of a student's history, newest first
+        Index("idx_assignments_student_uploaded", "student_id", uploaded_at.desc(), id.desc()),
+    )
+
+class UploadBlob(Base):
+    __tablename__ = "upload_blobs"
+
+    digest = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    released_at = Column(DateTime)
+
+class AssignmentChunk(Base):
+    __tablename__ = "assignment_chunks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    assignment_id = Column(Integer, ForeignKey("assignments.id", ondelete="CASCADE"), nullable=False, index=True)
+    chunk_index = Column(Integer, nullable=False)
+    page = Column(Integer)
+    content_hash = Column(String(64), nullable=False, index=True)
+    content = Column(Text)
+    embedding = Column(Vector(768))
+    flags = Column(JSONB)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class AnalysisResult(Base):
     __tablename__ = "analysis_results"
 
     id = Column(Integer, primary_key=True, index=True)
-    assignment_id = Column(Integer, ForeignKey("assignments.id", ondelete="CASCADE"), nullable=False)
+    assignment_id = Column(Integer, ForeignKey("assignments.id", ondelete="CASCADE"), nullable=False, unique=True)
     suggested_sources = Column(JSONB)
     plagiarism_score = Column(Float, default=0.0)
     flagged_sections = Column(JSONB)
     research_suggestions = Column(Text)
     citation_recommendations = Column(Text)
     confidence_score = Column(Float, default=0.0)
+    reused_from_assignment_id = Column(Integer)
+    degradation_level = Column(Integer, default=0)
+    degraded_stages = Column(JSONB)
     analyzed_at = Column(DateTime, default=datetime.utcnow)
 
     assignment = relationship("Assignment", back_populates="analysis")
@@ -0,0 +1,29 @@
+import logging
+from typing import Any, Dict
+
+from config import settings
+from http_clients import http_session
+
+logger = logging.getLogger(__name__)
+
+def trigger_analysis(webhook_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Run the n8n analysis workflow for one assignment.
+
+    The workflow answers from its final node, so this blocks until the
+    analysis has been stored. Raises on transport errors and non-200
+    responses so the job queue can retry.
+    """
+    response = http_session("n8n").post(
+        settings.N8N_WEBHOOK_URL,
+        json=webhook_data,
+        timeout=settings.N8N_WEBHOOK_TIMEOUT_SECONDS
+    )
+    logger.info(f"n8n responded {response.status_code} for assignment {webhook_data.get('assignment_id')}")
+
+    if response.status_code != 200:
+        raise RuntimeError(f"n8n webhook returned {response.status_code}: {response.text[:200]}")
+
+    try:
+        return response.json()
+    except ValueError:
+        return {"raw": response.text}
@@ -0,0 +1,117 @@
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import redis
+import redis.asyncio as aioredis
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+def _channel(assignment_id: int) -> str:
+    return f"analysis:events:{assignment_id}"
+
+def _last_key(assignment_id: int) -> str:
+    return f"analysis:events:last:{assignment_id}"
+
+def _connect() -> Optional[redis.Redis]:
+    try:
+        client = redis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            decode_responses=True,
+            socket_connect_timeout=5,
+            socket_timeout=5
+        )
+        client.ping()
+        return client
+    except redis.ConnectionError as e:
+        logger.error(f"❌ Status notifications disabled, Redis unavailable: {e}")
+        return None
+
+_publisher = _connect()
+_subscriber: Optional[aioredis.Redis] = None
+
+def _subscriber_client() -> aioredis.Redis:
+    """Async client shared by all streams; each pub/sub holds one pooled connection"""
+    global _subscriber
+    if _subscriber is None:
+        _subscriber = aioredis.Redis(host=settings.REDIS_HOST, port=settings.REDIS_PORT, decode_responses=True)
+    return _subscriber
+
+def publish_status(assignment_id: int, status: str, **details: Any):
+    """Announce an analysis status change to every subscribed API process.
+
+    The latest event is also kept for NOTIFY_LAST_EVENT_TTL_SECONDS so a
+    client that subscribes after the change still sees it.
+    """
+    if _publisher is None:
+        return
+    event = json.dumps({"assignment_id": assignment_id, "status": status, **details}, default=str)
+    try:
+        pipe = _publisher.pipeline()
+        pipe.setex(_last_key(assignment_id), settings.NOTIFY_LAST_EVENT_TTL_SECONDS, event)
+        pipe.publish(_channel(assignment_id), event)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"Could not publish status {status} for assignment {assignment_id}: {e}")
+
+def last_statuses(assignment_ids: List[int]) -> Dict[int, str]:
+    """Latest published status per assignment, in one round trip"""
+    if _publisher is None or not assignment_ids:
+        return {}
+    try:
+        events = _publisher.mget([_last_key(assignment_id) for assignment_id in assignment_ids])
+    except Exception as e:
+        logger.warning(f"Could not read analysis statuses: {e}")
+        return {}
+    return {
+        assignment_id: json.loads(event)["status"]
+        for assignment_id, event in zip(assignment_ids, events)
+        if event
+    }
+
+async def status_events(assignment_id: int) -> AsyncIterator[Optional[Dict[str, Any]]]:
+    """Status events for one assignment until it completes or fails.
+
+    Subscribes before reading the stored last event so nothing published in
+    between is missed. Yields None every NOTIFY_KEEPALIVE_SECONDS of silence
+    so the caller can send a keep-alive.
+    """
+    client = _subscriber_client()
+    pubsub = client.pubsub()
+    try:
+        await pubsub.subscribe(_channel(assignment_id))
+        last = await client.get(_last_key(assignment_id))
+        if last:
+            event = json.loads(last)
+            yield event
+            if event["status"] in TERMINAL_STATUSES:
+                return
+
+        while True:
+            message = await pubsub.get_message(
+                ignore_subscribe_messages=True,
+                timeout=settings.NOTIFY_KEEPALIVE_SECONDS
+            )
+            if message is None:
+                yield None
+                continue
+            event = json.loads(message["data"])
+            yield event
+            if event["status"] in TERMINAL_STATUSES:
+                return
+    finally:
+        try:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+        except Exception:
+            pass
+
+def format_sse(event: Optional[Dict[str, Any]]) -> str:
+    if event is None:
+        return ": keep-alive\n\n"
+    return f"event: {event['status']}\ndata: {json.dumps(event, default=str)}\n\n"
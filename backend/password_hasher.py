@@ -0,0 +1,70 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional, Tuple
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from config import settings
+from metrics import metrics, Sample
+
+class PasswordHasher:
+    """bcrypt on its own small executor, away from the request threadpool.
+
+    At most PASSWORD_HASH_WORKERS hashes run at once, so a login burst uses
+    that many cores and no more. Requests beyond PASSWORD_HASH_MAX_PENDING
+    waiting or running are refused with 503 rather than queued without end.
+    """
+
+    def __init__(self):
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
+        self._executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", self.context.hash, password)
+
+    async def verify_and_update(self, password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+        """Whether the password matches, and a new hash if the stored one uses an old work factor"""
+        return await self._run("verify", self.context.verify_and_update, password, password_hash)
+
+    async def _run(self, op: str, func, *args):
+        with self._lock:
+            if self._pending >= settings.PASSWORD_HASH_MAX_PENDING:
+                metrics.inc("password_hash_rejected_total", op=op)
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Too many sign-ins at once; please try again in a moment",
+                    headers={"Retry-After": "1"}
+                )
+            self._pending += 1
+
+        submitted = time.monotonic()
+
+        def timed():
+            started = time.monotonic()
+            metrics.observe("password_hash_queue_seconds", started - submitted, op=op)
+            try:
+                return func(*args)
+            finally:
+                metrics.observe("password_hash_seconds", time.monotonic() - started, op=op)
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, timed)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def pending(self) -> int:
+        return self._pending
+
+password_hasher = PasswordHasher()
+
+def _hasher_samples() -> Iterable[Sample]:
+    yield "password_hash_pending", {}, password_hasher.pending()
+    yield "password_hash_workers", {}, settings.PASSWORD_HASH_WORKERS
+
+metrics.register_collector(_hasher_samples)
@@ -149,14 +149,21 @@
 # rag_service = RAGService()
 import google.generativeai as genai
 import numpy as np
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import text, exc
+from sqlalchemy import text, exc, insert
 from config import settings
-from models import AcademicSource
+from models import AcademicSource, AssignmentChunk
+from file_processor import file_processor
+from fingerprints import SimHasher, WordChunker, chunk_hash, chunk_starts
+from single_flight import SingleFlight
+from deadline import Deadline
+from embedding_client import EmbeddingClient, EmbeddingUnavailable
 import redis
+import hashlib
 import json
 import logging
+import re
 import time
 import asyncio
 
@@ -167,6 +174,9 @@ class RAGService:
     def __init__(self):
         self._setup_connections()
         self.embedding_model = "models/embedding-001"
+        self.embeddings = EmbeddingClient(self.embedding_model, self.redis_client)
+        self._embedding_flight = SingleFlight("embedding", self.redis_client)
+        self._search_flight = SingleFlight("source_search", self.redis_client)
         logger.info("RAGService initialized")
 
     def _setup_connections(self):
@@ -192,63 +202,90 @@ class RAGService:
             if not settings.GEMINI_API_KEY:
                 raise ValueError("GEMINI_API_KEY not set in environment")
             
-            genai.configure(api_key=settings.GEMINI_API_KEY)
+            # The client and its channel are created once and reused for every call
+            genai.configure(api_key=settings.GEMINI_API_KEY, transport=settings.GEMINI_TRANSPORT)
             logger.info("✅ Gemini API configured successfully")
         except Exception as e:
             logger.error(f"❌ Gemini configuration failed: {e}")
             raise
 
-    def generate_embedding(self, text: str, max_retries: int = 3) -> List[float]:
-        """Generate embedding with retry logic and caching"""
+    def try_embedding(self, text: str) -> Optional[List[float]]:
+        """Cached or freshly generated embedding, or None when the provider is down"""
         if not text or not text.strip():
             logger.warning("Empty text provided for embedding")
             return [0.0] * 768  # Return zero vector for empty text
 
-        cache_key = f"embedding:{hash(text)}"
-        
         # Try cache first (if Redis is available)
-        if self.redis_client:
-            try:
-                cached = self.redis_client.get(cache_key)
-                if cached:
-                    logger.debug("Embedding retrieved from cache")
-                    return json.loads(cached)
-            except redis.RedisError as e:
-                logger.warning(f"Redis cache access failed: {e}")
+        cached = self._get_cached_embedding(text)
+        if cached is not None:
+            return cached
+
+        # Identical concurrent requests, in this process or another, share one provider call
+        return self._embedding_flight.do(
+            self._embedding_cache_key(text),
+            lambda: self._embed_and_cache(text),
+            lambda: self._get_cached_embedding(text)
+        )
+
+    def _embed_and_cache(self, text: str) -> Optional[List[float]]:
+        try:
+            embedding = self.embeddings.embed([text])[0]
+        except EmbeddingUnavailable as e:
+            logger.warning(f"Embedding generation failed: {e}")
+            return None
+        self._cache_embedding(text, embedding)
+        return embedding
+
+    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Embed a batch of texts, sending all cache misses in one provider call.
+
+        Raises EmbeddingUnavailable rather than inventing vectors: callers
+        leave the embedding NULL so the chunk is embedded on a later run.
+        """
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        missing = []
+        for i, chunk in enumerate(texts):
+            if not chunk or not chunk.strip():
+                embeddings[i] = [0.0] * 768
+                continue
+            cached = self._get_cached_embedding(chunk)
+            if cached is not None:
+                embeddings[i] = cached
+            else:
+                missing.append(i)
 
-        # Generate new embedding with retry logic
-        last_exception = None
-        for attempt in range(max_retries):
-            try:
-                logger.debug(f"Generating embedding for text: {text[:100]}... (attempt {attempt + 1})")
-                result = genai.embed_content(
-                    model=self.embedding_model,
-                    content=text,
-                    task_type="retrieval_document"
-                )
-                embedding = result['embedding']
-                
-                # Cache the result (if Redis is available)
-                if self.redis_client:
-                    try:
-                        self.redis_client.setex(cache_key, 3600, json.dumps(embedding))
-                        logger.debug("Embedding cached successfully")
-                    except redis.RedisError as e:
-                        logger.warning(f"Failed to cache embedding: {e}")
-                
-                return embedding
-                
-            except Exception as e:
-                last_exception = e
-                logger.warning(f"Embedding generation attempt {attempt + 1} failed: {e}")
-                if attempt < max_retries - 1:
-                    wait_time = 2 ** attempt  # Exponential backoff
-                    time.sleep(wait_time)
-        
-        # If all retries failed
-        logger.error(f"All embedding generation attempts failed. Last error: {last_exception}")
-        # Return a random embedding as fallback for testing
-        return list(np.random.normal(0, 0.1, 768).astype(float))
+        if missing:
+            # The client already retried; EmbeddingUnavailable propagates to the caller
+            for i, embedding in zip(missing, self.embeddings.embed([texts[i] for i in missing])):
+                embeddings[i] = embedding
+                self._cache_embedding(texts[i], embedding)
+
+        return embeddings
+
+    def _embedding_cache_key(self, text: str) -> str:
+        # sha256 rather than hash(): hash() is salted per process, so workers could not share entries
+        return f"embedding:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+    def _get_cached_embedding(self, text: str) -> Optional[List[float]]:
+        if not self.redis_client:
+            return None
+        try:
+            cached = self.redis_client.get(self._embedding_cache_key(text))
+            if cached:
+                logger.debug("Embedding retrieved from cache")
+                return json.loads(cached)
+        except redis.RedisError as e:
+            logger.warning(f"Redis cache access failed: {e}")
+        return None
+
+    def _cache_embedding(self, text: str, embedding: List[float]):
+        if not self.redis_client:
+            return
+        try:
+            self.redis_client.setex(self._embedding_cache_key(text), 3600, json.dumps(embedding))
+            logger.debug("Embedding cached successfully")
+        except redis.RedisError as e:
+            logger.warning(f"Failed to cache embedding: {e}")
 
     def search_similar_sources(
         self,
@@ -259,6 +296,19 @@ class RAGService:
         """
         Search for similar academic sources using vector similarity
         """
+        cache_key = self._search_cache_key(query, limit)
+        cached = self._get_cached_search(cache_key)
+        if cached is not None:
+            return cached
+
+        # A whole class searching the same prompt at once runs the search once
+        return self._search_flight.do(
+            cache_key,
+            lambda: self._search_similar_sources(db, query, limit, cache_key),
+            lambda: self._get_cached_search(cache_key)
+        )
+
+    def _search_similar_sources(self, db: Session, query: str, limit: int, cache_key: str) -> List[Dict[str, Any]]:
         logger.info(f"Searching sources for query: '{query}'")
         
         try:
@@ -288,41 +338,12 @@ class RAGService:
                 return self._get_fallback_sources()
 
             # Generate query embedding
-            query_embedding = self.generate_embedding(query)
-            embedding_str = "[" + ",".join(map(str, query_embedding)) + "]"
-
-            # Execute vector search
-            sql = text("""
-                SELECT
-                    id,
-                    title,
-                    authors,
-                    publication_year,
-                    abstract,
-                    source_type,
-                    1 - (embedding <=> :embedding::vector) as similarity
-                FROM academic_sources
-                WHERE embedding IS NOT NULL
-                ORDER BY embedding <=> :embedding::vector
-                LIMIT :limit
-            """)
-
-            result = db.execute(
-                sql,
-                {"embedding": embedding_str, "limit": limit}
-            )
-
-            sources = []
-            for row in result:
-                sources.append({
-                    "id": row[0],
-                    "title": row[1] or "Untitled",
-                    "authors": row[2] or "Unknown Authors",
-                    "publication_year": row[3] or 2024,
-                    "abstract": row[4] or "No abstract available",
-                    "source_type": row[5] or "paper",
-                    "similarity_score": float(row[6]) if row[6] is not None else 0.0
-                })
+            query_embedding = self.try_embedding(query)
+            if query_embedding is None:
+                logger.warning("Embeddings unavailable, using full-text search")
+                return self.lexical_search_sources(db, query, limit) or self._get_fallback_sources(limit)
+            sources = self._vector_search(db, query_embedding, limit)
+            self._cache_search(cache_key, sources)
 
             logger.info(f"Vector search completed. Found {len(sources)} sources")
             return sources
@@ -334,6 +355,149 @@ class RAGService:
             logger.error(f"Unexpected error in search_similar_sources: {e}")
             return self._get_fallback_sources()
 
+    def _search_cache_key(self, query: str, limit: int) -> str:
+        digest = hashlib.sha256(f"{limit}\n{query}".encode("utf-8")).hexdigest()
+        return f"sources:search:{digest}"
+
+    def _get_cached_search(self, cache_key: str) -> Optional[List[Dict[str, Any]]]:
+        if not self.redis_client:
+            return None
+        try:
+            cached = self.redis_client.get(cache_key)
+            return json.loads(cached) if cached else None
+        except redis.RedisError as e:
+            logger.warning(f"Redis cache access failed: {e}")
+            return None
+
+    def _cache_search(self, cache_key: str, sources: List[Dict[str, Any]]):
+        """Only vector search results are cached; fallbacks are retried on the next request"""
+        if not self.redis_client:
+            return
+        try:
+            self.redis_client.setex(cache_key, settings.SOURCE_SEARCH_CACHE_TTL_SECONDS, json.dumps(sources))
+        except redis.RedisError as e:
+            logger.warning(f"Failed to cache source search: {e}")
+
+    def search_sources_for_assignment(
+        self,
+        db: Session,
+        assignment_id: int,
+        limit: int = 5
+    ) -> List[Dict[str, Any]]:
+        """Sources relevant to a whole assignment.
+
+        Searches with the centroid of the assignment's first
+        RETRIEVAL_MAX_CHUNKS chunk embeddings. Embeddings already computed by
+        streaming or plagiarism detection are reused; missing ones are
+        computed once and stored on the chunk rows.
+        """
+        try:
+            rows = db.query(AssignmentChunk).filter(
+                AssignmentChunk.assignment_id == assignment_id
+            ).order_by(AssignmentChunk.chunk_index).limit(settings.RETRIEVAL_MAX_CHUNKS).all()
+            if not rows:
+                logger.warning(f"Assignment {assignment_id} has no chunks; using fallback sources")
+                return self._get_fallback_sources(limit)
+
+            missing = [row for row in rows if row.embedding is None]
+            if missing:
+                try:
+                    embeddings = self.generate_embeddings([row.content for row in missing])
+                except EmbeddingUnavailable as e:
+                    # Search the chunks' text instead; their embeddings stay NULL for a later run
+                    logger.warning(f"Embeddings unavailable ({e}), using full-text search for assignment {assignment_id}")
+                    query = " ".join(row.content for row in rows)
+                    return self.lexical_search_sources(db, query, limit)
+                for row, embedding in zip(missing, embeddings):
+                    row.embedding = embedding
+                db.commit()
+
+            centroid = np.mean([np.asarray(row.embedding, dtype=float) for row in rows], axis=0)
+            sources = self._vector_search(db, centroid, limit)
+            if not sources:
+                return self._get_fallback_sources(limit)
+
+            logger.info(f"Retrieved {len(sources)} sources for assignment {assignment_id} from {len(rows)} chunks")
+            return sources
+
+        except exc.SQLAlchemyError as e:
+            db.rollback()
+            logger.error(f"Database error in search_sources_for_assignment: {e}")
+            return self._get_fallback_sources(limit)
+
+    def lexical_search_sources(self, db: Session, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """Full-text source search with no embedding call, for analyses short on time"""
+        terms = sorted(set(re.findall(r"[a-z]{4,}", query.lower())))[:40]
+        if not terms:
+            return self._get_fallback_sources(limit)
+        try:
+            result = db.execute(text("""
+                SELECT id, title, authors, publication_year, abstract, source_type,
+                       ts_rank(
+                           to_tsvector('english', coalesce(title, '') || ' ' || coalesce(abstract, '')),
+                           to_tsquery('english', :query)
+                       ) AS rank
+                FROM academic_sources
+                WHERE to_tsvector('english', coalesce(title, '') || ' ' || coalesce(abstract, ''))
+                      @@ to_tsquery('english', :query)
+                ORDER BY rank DESC
+                LIMIT :limit
+            """), {"query": " | ".join(terms), "limit": limit})
+            sources = [
+                {
+                    "id": row[0],
+                    "title": row[1] or "Untitled",
+                    "authors": row[2] or "Unknown Authors",
+                    "publication_year": row[3] or 2024,
+                    "abstract": row[4] or "No abstract available",
+                    "source_type": row[5] or "paper",
+                    "similarity_score": float(row[6]) if row[6] is not None else 0.0
+                }
+                for row in result
+            ]
+        except exc.SQLAlchemyError as e:
+            db.rollback()
+            logger.error(f"Database error in lexical_search_sources: {e}")
+            return self._get_fallback_sources(limit)
+        return sources or self._get_fallback_sources(limit)
+
+    def _vector_search(self, db: Session, embedding, limit: int) -> List[Dict[str, Any]]:
+        """Nearest academic sources to an already computed embedding"""
+        embedding_str = "[" + ",".join(map(str, embedding)) + "]"
+
+        sql = text("""
+            SELECT
+                id,
+                title,
+                authors,
+                publication_year,
+                abstract,
+                source_type,
+                1 - (embedding <=> :embedding::vector) as similarity
+            FROM academic_sources
+            WHERE embedding IS NOT NULL
+            ORDER BY embedding <=> :embedding::vector
+            LIMIT :limit
+        """)
+
+        result = db.execute(
+            sql,
+            {"embedding": embedding_str, "limit": limit}
+        )
+
+        sources = []
+        for row in result:
+            sources.append({
+                "id": row[0],
+                "title": row[1] or "Untitled",
+                "authors": row[2] or "Unknown Authors",
+                "publication_year": row[3] or 2024,
+                "abstract": row[4] or "No abstract available",
+                "source_type": row[5] or "paper",
+                "similarity_score": float(row[6]) if row[6] is not None else 0.0
+            })
+        return sources
+
     def _get_fallback_sources(self, limit: int = 5) -> List[Dict[str, Any]]:
         """Provide fallback sources when the main search fails"""
         logger.info("Using fallback academic sources")
@@ -388,78 +552,299 @@ class RAGService:
         
         return fallback_sources[:limit]
 
-    def detect_plagiarism(
+    def _chunk_text(self, text: str, chunk_size: int = 500) -> List[str]:
+        """Split text into chunks for processing"""
+        if not text:
+            return []
+            
+        words = text.split()
+        if len(words) <= chunk_size:
+            return [text]
+
+        # Content-defined boundaries, so an edit only re-hashes the chunks around it
+        starts = chunk_starts(words, chunk_size)
+        return [" ".join(words[start:end]) for start, end in zip(starts, starts[1:] + [len(words)])]
+
+    def _chunk_offsets(self, text: str, chunk_size: int = 500) -> List[int]:
+        """Character offset at which each _chunk_text chunk starts"""
+        word_offsets = [m.start() for m in re.finditer(r"\S+", text)]
+        if len(word_offsets) <= chunk_size:
+            return [0]
+        return [word_offsets[start] for start in chunk_starts(text.split(), chunk_size)]
+
+    def iter_chunks(
+        self,
+        pages: Iterable[str],
+        chunk_size: int = 500
+    ) -> Iterator[Tuple[int, int, str]]:
+        """Incrementally chunk a page stream, yielding (chunk_index, start_page, chunk).
+
+        Uses the same content-defined boundaries as _chunk_text.
+        """
+        chunker = WordChunker(chunk_size)
+        buffer: List[str] = []
+        buffer_page = 1
+        index = 0
+        for page_number, page in enumerate(pages, start=1):
+            for word in page.split():
+                if not buffer:
+                    buffer_page = page_number
+                buffer.append(word)
+                if chunker.boundary_after(word):
+                    yield index, buffer_page, " ".join(buffer)
+                    index += 1
+                    buffer = []
+        if buffer:
+            yield index, buffer_page, " ".join(buffer)
+
+    def ingest_assignment_stream(
         self,
         db: Session,
-        text: str,
-        threshold: float = 0.85
+        assignment_id: int,
+        pages: Iterable[str],
+        batch_size: Optional[int] = None,
+        paged: bool = True
     ) -> Dict[str, Any]:
-        """Detect potential plagiarism by comparing with academic sources"""
-        logger.info("Starting plagiarism detection")
-        
-        if not text or len(text.strip()) < 50:
-            return {
-                "plagiarism_score": 0.0,
-                "flagged_sections": [],
-                "message": "Text too short for meaningful plagiarism detection"
-            }
+        """Chunk, fingerprint and persist a page stream in bounded batches.
+
+        Only one batch of chunks is alive at a time and rows are written with
+        core inserts (nothing accumulates in the session), so peak memory does
+        not depend on document size. Embeddings are left to the analysis job,
+        like record_assignment_chunks, so the upload request never calls the
+        provider. Pass paged=False when the stream's blocks are not real pages
+        (DOCX/TXT); chunks are then stored without a page number.
+        """
+        batch_size = batch_size or settings.STREAM_EMBED_BATCH_SIZE
+        word_count = 0
+        chunk_count = 0
+        preview_words: List[str] = []
+        sketch = SimHasher()
+        batch: List[Tuple[int, int, str]] = []
+
+        def flush():
+            db.execute(insert(AssignmentChunk), [
+                {
+                    "assignment_id": assignment_id,
+                    "chunk_index": index,
+                    "page": page if paged else None,
+                    "content_hash": chunk_hash(chunk),
+                    "content": chunk
+                }
+                for index, page, chunk in batch
+            ])
+            db.commit()
 
-        try:
-            text_chunks = self._chunk_text(text, chunk_size=500)
-            flagged_sections = []
-            max_similarity = 0.0
+        for index, page, chunk in self.iter_chunks(pages):
+            words = chunk.split()
+            word_count += len(words)
+            chunk_count += 1
+            sketch.update(words)
+            if len(preview_words) < 100:
+                preview_words.extend(words[:100 - len(preview_words)])
+
+            batch.append((index, page, chunk))
+            if len(batch) >= batch_size:
+                flush()
+                batch = []
+        if batch:
+            flush()
+
+        logger.info(f"Streamed assignment {assignment_id}: {chunk_count} chunks, {word_count} words")
+        return {
+            "word_count": word_count,
+            "chunk_count": chunk_count,
+            "preview": " ".join(preview_words),
+            "sketch": sketch.digest()
+        }
+
+    def copy_assignment_chunks(
+        self,
+        db: Session,
+        source_assignment_id: int,
+        target_assignment_id: int
+    ) -> Dict[str, Any]:
+        """Reuse the stored chunks of an identical upload; returns the same stats as ingest_assignment_stream"""
+        db.execute(
+            text("""
+                INSERT INTO assignment_chunks
+                    (assignment_id, chunk_index, page, content_hash, content, embedding)
+                SELECT :target, chunk_index, page, content_hash, content, embedding
+                FROM assignment_chunks
+                WHERE assignment_id = :source
+            """),
+            {"source": source_assignment_id, "target": target_assignment_id}
+        )
+        db.commit()
+
+        row = db.execute(
+            text("""
+                SELECT a.word_count,
+                       a.similarity_sketch,
+                       (SELECT COUNT(*) FROM assignment_chunks WHERE assignment_id = :target),
+                       (SELECT content FROM assignment_chunks WHERE assignment_id = :target AND chunk_index = 0)
+                FROM assignments a
+                WHERE a.id = :source
+            """),
+            {"source": source_assignment_id, "target": target_assignment_id}
+        ).first()
+        first_chunk = row[3] or ""
+
+        return {
+            "word_count": row[0] or 0,
+            "chunk_count": row[2],
+            "preview": " ".join(first_chunk.split()[:100]),
+            "sketch": row[1]
+        }
+
+    def record_assignment_chunks(
+        self,
+        db: Session,
+        assignment_id: int,
+        text: str,
+        page_map: Optional[List[Dict[str, int]]] = None
+    ) -> int:
+        """Fingerprint an assignment's chunks; embeddings are filled in when it is analysed"""
+        chunks = self._chunk_text(text, chunk_size=500)
+        offsets = self._chunk_offsets(text, chunk_size=500) if page_map else []
+        if chunks:
+            db.execute(insert(AssignmentChunk), [
+                {
+                    "assignment_id": assignment_id,
+                    "chunk_index": i,
+                    "page": file_processor.page_for_offset(page_map, offsets[i]) if offsets else None,
+                    "content_hash": chunk_hash(chunk),
+                    "content": chunk
+                }
+                for i, chunk in enumerate(chunks)
+            ])
+            db.commit()
+        return len(chunks)
 
-            for i, chunk in enumerate(text_chunks):
-                if len(chunk.strip()) < 100:  # Skip very short chunks
+    def detect_plagiarism_incremental(
+        self,
+        db: Session,
+        assignment_id: int,
+        predecessor_id: Optional[int] = None,
+        threshold: float = 0.85,
+        deadline: Optional[Deadline] = None,
+        reserve_seconds: float = 0.0
+    ) -> Dict[str, Any]:
+        """Chunk-level plagiarism detection over assignment_chunks.
+
+        A chunk whose content hash was already analysed on the predecessor
+        reuses that embedding and those flags; only new or edited chunks are
+        embedded and searched, so the cost follows the size of the edit.
+        Results are persisted on the chunk rows for the next revision. Only
+        this method writes chunk flags, so after an n8n analysis (which does
+        not) a predecessor contributes just the embeddings it has, and the
+        unchanged chunks are searched again.
+
+        With a deadline, scanning stops once less than reserve_seconds remain
+        and the result is marked incomplete. Chunks that cannot be embedded
+        keep NULL flags, so a later run scans them, and also make the result
+        incomplete.
+        """
+        batch_size = settings.STREAM_EMBED_BATCH_SIZE
+        flagged_sections = []
+        max_similarity = 0.0
+        total = reused = recomputed = 0
+        last_index = -1
+        complete = True
+        embeddings_down = False
+
+        while True:
+            if deadline is not None and deadline.remaining() < reserve_seconds:
+                complete = False
+                break
+            rows = db.query(AssignmentChunk).filter(
+                AssignmentChunk.assignment_id == assignment_id,
+                AssignmentChunk.chunk_index > last_index
+            ).order_by(AssignmentChunk.chunk_index).limit(batch_size).all()
+            if not rows:
+                break
+            last_index = rows[-1].chunk_index
+            total += len(rows)
+
+            pending = [row for row in rows if row.flags is None]
+            if pending and predecessor_id:
+                known = {
+                    prior.content_hash: prior
+                    for prior in db.query(
+                        AssignmentChunk.content_hash,
+                        AssignmentChunk.embedding,
+                        AssignmentChunk.flags
+                    ).filter(
+                        AssignmentChunk.assignment_id == predecessor_id,
+                        AssignmentChunk.content_hash.in_([row.content_hash for row in pending]),
+                        AssignmentChunk.flags.isnot(None) | AssignmentChunk.embedding.isnot(None)
+                    )
+                }
+                for row in pending:
+                    prior = known.get(row.content_hash)
+                    if prior is None:
+                        continue
+                    if row.embedding is None:
+                        row.embedding = prior.embedding
+                    if prior.flags is not None:
+                        row.flags = [dict(flag, chunk_index=row.chunk_index, page=row.page) for flag in prior.flags]
+                        reused += 1
+                pending = [row for row in pending if row.flags is None]
+
+            searchable = [row for row in pending if len(row.content.strip()) >= 100]
+            to_embed = [row for row in searchable if row.embedding is None]
+            if to_embed and not embeddings_down:
+                try:
+                    for row, embedding in zip(to_embed, self.generate_embeddings([row.content for row in to_embed])):
+                        row.embedding = embedding
+                except EmbeddingUnavailable as e:
+                    logger.warning(f"Embeddings unavailable, leaving chunks of assignment {assignment_id} unscanned: {e}")
+                    embeddings_down = True
+
+            for row in pending:
+                if len(row.content.strip()) < 100:  # Skip very short chunks
+                    recomputed += 1
+                    row.flags = []
+                    continue
+                if row.embedding is None:
+                    complete = False
                     continue
-                    
-                similar_sources = self.search_similar_sources(db, chunk, limit=2)
-                
-                for source in similar_sources:
+                recomputed += 1
+                row.flags = []
+                for source in self._vector_search(db, row.embedding, limit=2):
                     if source['similarity_score'] > threshold:
-                        flagged_sections.append({
-                            "chunk_index": i,
-                            "text": chunk[:200] + "..." if len(chunk) > 200 else chunk,
+                        row.flags.append({
+                            "chunk_index": row.chunk_index,
+                            "text": row.content[:200] + "..." if len(row.content) > 200 else row.content,
                             "matched_source": source['title'],
                             "similarity": source['similarity_score'],
-                            "source_authors": source['authors']
+                            "source_authors": source['authors'],
+                            "page": row.page
                         })
-                        max_similarity = max(max_similarity, source['similarity_score'])
 
-            plagiarism_score = min(max_similarity, 1.0)  # Ensure score doesn't exceed 1.0
-
-            result = {
-                "plagiarism_score": plagiarism_score,
-                "flagged_sections": flagged_sections,
-                "total_chunks_analyzed": len(text_chunks),
-                "chunks_flagged": len(flagged_sections)
-            }
-            
-            logger.info(f"Plagiarism detection completed. Score: {plagiarism_score}")
-            return result
-
-        except Exception as e:
-            logger.error(f"Plagiarism detection failed: {e}")
-            return {
-                "plagiarism_score": 0.0,
-                "flagged_sections": [],
-                "error": str(e)
-            }
-
-    def _chunk_text(self, text: str, chunk_size: int = 500) -> List[str]:
-        """Split text into chunks for processing"""
-        if not text:
-            return []
-            
-        words = text.split()
-        if len(words) <= chunk_size:
-            return [text]
-            
-        chunks = []
-        for i in range(0, len(words), chunk_size):
-            chunk = " ".join(words[i:i + chunk_size])
-            chunks.append(chunk)
-        return chunks
+            # Read the flags before committing: the commit expires every row
+            for row in rows:
+                for flag in row.flags or []:
+                    flagged_sections.append(flag)
+                    max_similarity = max(max_similarity, flag['similarity'])
+            db.commit()
+            for row in rows:
+                db.expunge(row)
+
+        logger.info(
+            f"Incremental plagiarism check for assignment {assignment_id}: "
+            f"{recomputed} chunks recomputed, {reused} reused"
+            + ("" if complete else ", stopped early for the deadline")
+        )
+        return {
+            "complete": complete,
+            "plagiarism_score": min(max_similarity, 1.0),
+            "flagged_sections": flagged_sections,
+            "total_chunks_analyzed": total,
+            "chunks_flagged": len(flagged_sections),
+            "chunks_reused": reused,
+            "chunks_recomputed": recomputed,
+            "chunks_scanned": reused + recomputed
+        }
 
     def add_academic_source(
         self,
@@ -476,7 +861,10 @@ class RAGService:
         
         try:
             text_for_embedding = f"{title}. {abstract}. {full_text[:1000]}"
-            embedding = self.generate_embedding(text_for_embedding)
+            # None when the provider is down: the row is stored and skipped by vector search until embedded
+            embedding = self.try_embedding(text_for_embedding)
+            if embedding is None:
+                logger.warning(f"Adding source '{title}' without an embedding")
 
             source = AcademicSource(
                 title=title,
@@ -522,8 +910,12 @@ class RAGService:
 
         # Check Gemini API
         try:
+            if not self.embeddings.available():
+                raise RuntimeError("embedding circuit breaker is open")
             # Simple embedding test
-            test_embedding = self.generate_embedding("test")
+            test_embedding = self.try_embedding("test")
+            if test_embedding is None:
+                raise RuntimeError("embedding provider unavailable")
             if len(test_embedding) == 768:
                 health_status["components"]["gemini"] = "healthy"
             else:
@@ -0,0 +1,197 @@
+import logging
+from typing import Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from analysis_store import publish_completed, upsert_analysis_results
+from config import settings
+from deadline import degradation_level
+from fingerprints import hamming_distance
+from models import Assignment, AnalysisResult, AssignmentChunk
+from rag_service import rag_service
+
+logger = logging.getLogger(__name__)
+
+def find_prior_match(db: Session, assignment: Assignment) -> Optional[Tuple[str, int]]:
+    """Find an analysed earlier submission by the same student that this one duplicates.
+
+    Returns ("exact", assignment_id) for identical bytes, ("near", assignment_id)
+    for the closest sketch within NEAR_DUPLICATE_MAX_HAMMING bits, or None.
+    """
+    candidates = db.query(
+        Assignment.id,
+        Assignment.content_digest,
+        Assignment.similarity_sketch
+    ).join(
+        AnalysisResult, AnalysisResult.assignment_id == Assignment.id
+    ).filter(
+        Assignment.student_id == assignment.student_id,
+        Assignment.id != assignment.id
+    ).order_by(Assignment.id.desc()).limit(settings.RESUBMISSION_LOOKBACK).all()
+
+    best: Optional[Tuple[int, int]] = None
+    for candidate in candidates:
+        if assignment.content_digest and candidate.content_digest == assignment.content_digest:
+            return "exact", candidate.id
+        if assignment.similarity_sketch is None or candidate.similarity_sketch is None:
+            continue
+        distance = hamming_distance(assignment.similarity_sketch, candidate.similarity_sketch)
+        if distance <= settings.NEAR_DUPLICATE_MAX_HAMMING and (best is None or distance < best[0]):
+            best = (distance, candidate.id)
+
+    return ("near", best[1]) if best else None
+
+def _normalize_whitespace(text: str) -> str:
+    return " ".join(text.split())
+
+def reuse_prior_analysis(
+    db: Session,
+    assignment: Assignment,
+    text: Optional[str] = None
+) -> Optional[AnalysisResult]:
+    """Copy the analysis of a duplicate earlier submission onto this assignment.
+
+    For near-duplicates the copy is patched against the new text: flagged
+    sections whose excerpt no longer appears are dropped. Returns None when
+    there is nothing to reuse and the full pipeline has to run.
+    """
+    if not settings.RESUBMISSION_REUSE_ENABLED:
+        return None
+
+    match = find_prior_match(db, assignment)
+    if match is None:
+        return None
+    kind, prior_id = match
+
+    prior = db.query(AnalysisResult).filter(AnalysisResult.assignment_id == prior_id).first()
+    prior_assignment = db.query(Assignment.topic, Assignment.academic_level).filter(Assignment.id == prior_id).first()
+
+    flagged_sections = prior.flagged_sections or []
+    plagiarism_score = prior.plagiarism_score
+    if kind == "near" and text is not None and flagged_sections:
+        # Excerpts come from re-joined chunks, so compare with whitespace collapsed on both sides
+        normalized = _normalize_whitespace(text)
+        kept = [
+            section for section in flagged_sections
+            if not section.get("text") or _normalize_whitespace(section["text"].rstrip(".")) in normalized
+        ]
+        if len(kept) != len(flagged_sections):
+            plagiarism_score = max((float(section.get("similarity") or 0.0) for section in kept), default=0.0)
+        flagged_sections = kept
+
+    analysis = AnalysisResult(
+        assignment_id=assignment.id,
+        suggested_sources=prior.suggested_sources,
+        plagiarism_score=plagiarism_score,
+        flagged_sections=flagged_sections,
+        research_suggestions=prior.research_suggestions,
+        citation_recommendations=prior.citation_recommendations,
+        confidence_score=prior.confidence_score,
+        reused_from_assignment_id=prior_id
+    )
+    assignment.topic = prior_assignment.topic
+    assignment.academic_level = prior_assignment.academic_level
+
+    db.add(analysis)
+    db.commit()
+    db.refresh(analysis)
+
+    publish_completed(analysis, assignment.student_id)
+    logger.info(f"Assignment {assignment.id} is a {kind} resubmission of {prior_id}; analysis reused")
+    return analysis
+
+def find_predecessor(db: Session, assignment: Assignment) -> Optional[int]:
+    """Analysed submission this one is a revision of.
+
+    The sketch must be within REVISION_MAX_HAMMING bits; a matching
+    filename alone (every student has an "essay.docx") is not enough. Among
+    close candidates the same filename wins, then the closest sketch.
+    """
+    if assignment.similarity_sketch is None:
+        return None
+
+    candidates = db.query(
+        Assignment.id,
+        Assignment.filename,
+        Assignment.similarity_sketch
+    ).join(
+        AnalysisResult, AnalysisResult.assignment_id == Assignment.id
+    ).filter(
+        Assignment.student_id == assignment.student_id,
+        Assignment.id != assignment.id
+    ).order_by(Assignment.id.desc()).limit(settings.RESUBMISSION_LOOKBACK).all()
+
+    best: Optional[Tuple[bool, int, int]] = None
+    for candidate in candidates:
+        if candidate.similarity_sketch is None:
+            continue
+        distance = hamming_distance(assignment.similarity_sketch, candidate.similarity_sketch)
+        if distance > settings.REVISION_MAX_HAMMING:
+            continue
+        # Candidates come newest first, so ties keep the most recent
+        rank = (candidate.filename != assignment.filename, distance)
+        if best is None or rank < best[:2]:
+            best = (*rank, candidate.id)
+    return best[2] if best else None
+
+def reanalyze_revision(db: Session, assignment: Assignment) -> Optional[AnalysisResult]:
+    """Analyse a revised submission by recomputing only its changed chunks.
+
+    The chunk fingerprints are diffed against the predecessor; if no more
+    than INCREMENTAL_MAX_CHANGED_RATIO of them changed, plagiarism results
+    are merged chunk by chunk and the predecessor's LLM feedback is carried
+    over into a new AnalysisResult. Otherwise returns None and the full
+    pipeline runs.
+    """
+    if not settings.INCREMENTAL_REANALYSIS_ENABLED:
+        return None
+
+    predecessor_id = find_predecessor(db, assignment)
+    if predecessor_id is None:
+        return None
+
+    total = db.query(func.count(AssignmentChunk.id)).filter(
+        AssignmentChunk.assignment_id == assignment.id
+    ).scalar()
+    if not total:
+        return None
+    previous_hashes = db.query(AssignmentChunk.content_hash).filter(
+        AssignmentChunk.assignment_id == predecessor_id
+    )
+    changed = db.query(func.count(AssignmentChunk.id)).filter(
+        AssignmentChunk.assignment_id == assignment.id,
+        AssignmentChunk.content_hash.notin_(previous_hashes)
+    ).scalar()
+    if changed / total > settings.INCREMENTAL_MAX_CHANGED_RATIO:
+        return None
+
+    plagiarism = rag_service.detect_plagiarism_incremental(db, assignment.id, predecessor_id)
+    prior = db.query(AnalysisResult).filter(AnalysisResult.assignment_id == predecessor_id).first()
+    prior_assignment = db.query(Assignment.topic, Assignment.academic_level).filter(Assignment.id == predecessor_id).first()
+
+    # Some changed chunks could not be embedded; they stay unscanned until a re-check
+    degraded = [] if plagiarism["complete"] else ["partial_plagiarism"]
+    assignment.topic = prior_assignment.topic
+    assignment.academic_level = prior_assignment.academic_level
+
+    # Upsert, so a job retried after this commit replaces the row instead of hitting the unique index
+    upsert_analysis_results(db, [{
+        "assignment_id": assignment.id,
+        "suggested_sources": prior.suggested_sources,
+        "plagiarism_score": plagiarism["plagiarism_score"],
+        "flagged_sections": plagiarism["flagged_sections"],
+        "research_suggestions": prior.research_suggestions,
+        "citation_recommendations": prior.citation_recommendations,
+        "confidence_score": prior.confidence_score,
+        "reused_from_assignment_id": predecessor_id,
+        "degradation_level": degradation_level(degraded),
+        "degraded_stages": degraded
+    }])
+    analysis = db.query(AnalysisResult).filter(AnalysisResult.assignment_id == assignment.id).first()
+
+    logger.info(
+        f"Assignment {assignment.id} is a revision of {predecessor_id}: "
+        f"{changed}/{total} chunks changed, merged into a new analysis"
+    )
+    return analysis
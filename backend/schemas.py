@@ -34,8 +34,26 @@ class AssignmentUploadResponse(BaseModel):
     assignment_id: int
     message: str
     status: str
+    estimated_completion_seconds: Optional[float] = None
 
 
+class AssignmentSummary(BaseModel):
+    assignment_id: int
+    filename: str
+    topic: Optional[str] = None
+    academic_level: Optional[str] = None
+    word_count: int = 0
+    uploaded_at: Optional[datetime] = None
+    status: str
+    plagiarism_score: Optional[float] = None
+    confidence_score: Optional[float] = None
+    degradation_level: Optional[int] = None
+    analyzed_at: Optional[datetime] = None
+
+class AssignmentListResponse(BaseModel):
+    items: List[AssignmentSummary]
+    next_cursor: Optional[str] = None
+
 class AnalysisResponse(BaseModel):
     assignment_id: int
     plagiarism_score: float
@@ -44,15 +62,37 @@ class AnalysisResponse(BaseModel):
     citation_recommendations: Optional[str] = None
     suggested_sources: Optional[List[Dict[str, Any]]] = None
     flagged_sections: Optional[List[Dict[str, Any]]] = None
+    reused_from_assignment_id: Optional[int] = None
+    degradation_level: int = 0
+    degraded_stages: Optional[List[str]] = None
     analyzed_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True  # This is important for ORM compatibility
 
+class AnalysisIngestResponse(BaseModel):
+    stored: int
+    assignment_ids: List[int]
+    missing_assignment_ids: List[int]
+
 class SourceSearchRequest(BaseModel):
     query: str
     limit: int = 5
 
+class RetrievalRequest(BaseModel):
+    assignment_id: int
+    limit: int = 5
+
+class LLMGenerateRequest(BaseModel):
+    prompt: str
+    model: Optional[str] = None
+    deadline_at: Optional[float] = None
+    # Semantic cache reuse needs the prompt's template parts and the student's text
+    topic: Optional[str] = None
+    academic_level: Optional[str] = None
+    source_titles: List[str] = []
+    semantic_text: Optional[str] = None
+
 class AcademicSourceResponse(BaseModel):
     id: int
     title: str
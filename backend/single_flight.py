@@ -0,0 +1,118 @@
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+import redis
+
+from config import settings
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Delete the lease only if we still hold it
+_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+class SingleFlight:
+    """Runs one computation per key at a time and shares its result.
+
+    In a process, concurrent callers of a key wait for the first caller's
+    result. Across processes the first caller takes a Redis lease; the
+    others poll `load` (the shared cache the leader's `compute` writes to)
+    until the value shows up or the lease is gone, and only then compute it
+    themselves.
+    """
+
+    def __init__(self, name: str, redis_client=None):
+        self.name = name
+        self.redis = redis_client
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._release = redis_client.register_script(_RELEASE) if redis_client is not None else None
+
+    def do(self, key: str, compute: Callable[[], Any], load: Optional[Callable[[], Any]] = None) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.inc("single_flight_total", flight=self.name, role="local_follower")
+            if call.done.wait(settings.SINGLE_FLIGHT_LEASE_SECONDS):
+                if call.error is not None:
+                    raise call.error
+                return call.value
+            return compute()
+
+        try:
+            call.value = self._do_shared(key, compute, load)
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _do_shared(self, key: str, compute: Callable[[], Any], load: Optional[Callable[[], Any]]) -> Any:
+        if self.redis is None or load is None:
+            metrics.inc("single_flight_total", flight=self.name, role="leader")
+            return compute()
+
+        lease_key = f"singleflight:{self.name}:{key}"
+        token = uuid.uuid4().hex
+        try:
+            acquired = self.redis.set(lease_key, token, nx=True, px=int(settings.SINGLE_FLIGHT_LEASE_SECONDS * 1000))
+        except redis.RedisError as e:
+            logger.warning(f"Single-flight lease unavailable for {self.name}: {e}")
+            return compute()
+
+        if acquired:
+            try:
+                # Another process may have finished between our cache miss and the lease
+                value = load()
+                if value is not None:
+                    metrics.inc("single_flight_total", flight=self.name, role="remote_follower")
+                    return value
+                metrics.inc("single_flight_total", flight=self.name, role="leader")
+                return compute()
+            finally:
+                try:
+                    self._release(keys=[lease_key], args=[token])
+                except redis.RedisError:
+                    pass
+
+        give_up_at = time.monotonic() + settings.SINGLE_FLIGHT_LEASE_SECONDS
+        while time.monotonic() < give_up_at:
+            time.sleep(settings.SINGLE_FLIGHT_POLL_SECONDS)
+            value = load()
+            if value is not None:
+                metrics.inc("single_flight_total", flight=self.name, role="remote_follower")
+                return value
+            try:
+                if not self.redis.exists(lease_key):
+                    break
+            except redis.RedisError:
+                break
+
+        # The leader gave up or failed without caching anything
+        value = load()
+        if value is not None:
+            metrics.inc("single_flight_total", flight=self.name, role="remote_follower")
+            return value
+        metrics.inc("single_flight_total", flight=self.name, role="leader")
+        return compute()
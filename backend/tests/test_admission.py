@@ -0,0 +1,64 @@
+import pytest
+from fastapi import HTTPException
+
+from admission import AdmissionController
+from config import settings
+
+class FakeQueue:
+    def __init__(self, pending=0, running=0, slots=4, avg_job_seconds=10.0, backlog=0):
+        self.pending, self.running, self.slots = pending, running, slots
+        self.avg_job_seconds, self.backlog = avg_job_seconds, backlog
+
+    def depth(self):
+        return {"pending": self.pending, "lanes": {"draft": self.pending}, "running": self.running, "delayed": 0, "dead": 0}
+
+    def capacity(self):
+        return {"worker_slots": self.slots, "avg_job_seconds": self.avg_job_seconds}
+
+    def student_backlog(self, student_id):
+        return self.backlog
+
+@pytest.fixture(autouse=True)
+def admission_settings(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_CONTROL_ENABLED", True)
+    monkeypatch.setattr(settings, "ADMISSION_SNAPSHOT_SECONDS", 0)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_PENDING", 100)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_WAIT_SECONDS", 600)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_PER_STUDENT", 5)
+    monkeypatch.setattr(settings, "ADMISSION_TARGET_WAIT_SECONDS", 60)
+
+def rejection(controller):
+    with pytest.raises(HTTPException) as info:
+        controller.admit(1)
+    return info.value
+
+def test_admits_with_an_estimate_from_the_drain_rate():
+    # 20 jobs at 10s each over 4 slots: 50s wait, plus the upload's own job
+    assert AdmissionController(FakeQueue(pending=20)).admit(1) == 60.0
+
+def test_no_queue_means_no_admission_control():
+    assert AdmissionController(None).admit(1) is None
+
+def test_student_over_their_limit_gets_429():
+    error = rejection(AdmissionController(FakeQueue(backlog=5)))
+    assert error.status_code == 429
+    assert int(error.headers["Retry-After"]) >= 1
+
+def test_full_backlog_gets_503_with_retry_after():
+    error = rejection(AdmissionController(FakeQueue(pending=100)))
+    assert error.status_code == 503
+    assert 1 <= int(error.headers["Retry-After"]) <= 600
+
+def test_long_wait_gets_503():
+    # 99 jobs at 31s over one slot is about a 3000s wait
+    error = rejection(AdmissionController(FakeQueue(pending=99, slots=1, avg_job_seconds=31.0)))
+    assert error.status_code == 503
+
+def test_pending_work_without_workers_gets_503():
+    error = rejection(AdmissionController(FakeQueue(pending=1, slots=0)))
+    assert error.status_code == 503
+
+def test_snapshot_suggests_enough_slots_for_the_target_wait():
+    snapshot = AdmissionController(FakeQueue(pending=30, running=2)).snapshot()
+    # 30 jobs * 10s within 60s needs 5 more slots on top of the 2 running
+    assert snapshot["desired_worker_slots"] == 7
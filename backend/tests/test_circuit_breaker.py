@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from circuit_breaker import CircuitBreaker
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+def failing_probe():
+    raise RuntimeError("still down")
+
+@pytest.fixture(params=["local", "redis"])
+def make_breaker(request, redis_client):
+    def make(probe=failing_probe, **kwargs):
+        options = {"failure_threshold": 3, "window_seconds": 60, "open_seconds": 30, "probe_interval": 10}
+        options.update(kwargs)
+        return CircuitBreaker("test", probe, redis_client if request.param == "redis" else None, **options)
+    return make
+
+def test_opens_after_threshold_failures(make_breaker):
+    breaker = make_breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+def test_success_resets_the_failure_count(make_breaker):
+    breaker = make_breaker()
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.allow()
+
+def test_successful_probe_closes_the_breaker(make_breaker):
+    probes = []
+    breaker = make_breaker(probe=lambda: probes.append(1), probe_interval=0.02)
+    breaker.trip()
+    assert not breaker.allow()
+    assert wait_for(lambda: probes and breaker.allow())
+
+def test_failed_probe_keeps_the_breaker_open(make_breaker):
+    breaker = make_breaker(probe_interval=0.02, open_seconds=0.05)
+    breaker.trip()
+    time.sleep(0.2)
+    breaker._cached_at = 0.0
+    assert not breaker.allow()
+
+def test_open_state_and_failures_are_shared_through_redis(redis_client):
+    first = CircuitBreaker("shared", failing_probe, redis_client, failure_threshold=2, probe_interval=10)
+    second = CircuitBreaker("shared", failing_probe, redis_client, failure_threshold=2, probe_interval=10)
+    first.record_failure()
+    second.record_failure()
+    assert not second.allow()
+    assert not first.allow()
+
+    second.close()
+    first._cached_at = 0.0
+    assert first.allow()
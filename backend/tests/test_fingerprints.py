@@ -0,0 +1,46 @@
+import random
+
+from fingerprints import SimHasher, WordChunker, chunk_starts, hamming_distance, sketch_text
+
+def words(n, seed=0):
+    rng = random.Random(seed)
+    return [f"w{rng.randrange(5000)}" for _ in range(n)]
+
+def chunks(text_words, avg_words=50):
+    starts = chunk_starts(text_words, avg_words)
+    return [tuple(text_words[start:end]) for start, end in zip(starts, starts[1:] + [len(text_words)])]
+
+def test_chunks_respect_size_bounds():
+    chunker = WordChunker(50)
+    sizes = [len(chunk) for chunk in chunks(words(5000))]
+    assert all(chunker.min_words <= size <= chunker.max_words for size in sizes[:-1])
+    assert sizes[-1] <= chunker.max_words
+    assert 25 <= sum(sizes) / len(sizes) <= 100
+
+def test_chunks_cover_every_word_once():
+    text = words(1234)
+    assert [word for chunk in chunks(text) for word in chunk] == text
+
+def test_an_edit_only_changes_nearby_chunks():
+    original = words(5000)
+    edited = original[:2000] + ["inserted"] + original[2000:3000] + original[3001:]
+    before, after = set(chunks(original)), set(chunks(edited))
+    assert len(after - before) <= 4
+    assert len(before & after) >= len(before) - 4
+
+def test_boundaries_do_not_depend_on_the_chunker_instance():
+    text = words(3000, seed=1)
+    chunker = WordChunker(50)
+    starts = [0] + [i + 1 for i, word in enumerate(text) if chunker.boundary_after(word) and i + 1 < len(text)]
+    assert starts == chunk_starts(text, 50)
+
+def test_simhash_is_incremental_and_tolerates_small_edits():
+    text = words(2000, seed=2)
+    hasher = SimHasher()
+    for start in range(0, len(text), 333):
+        hasher.update(text[start:start + 333])
+    assert hasher.digest() == sketch_text(" ".join(text))
+
+    edited = text[:1000] + ["changed"] + text[1001:]
+    assert hamming_distance(sketch_text(" ".join(text)), sketch_text(" ".join(edited))) <= 3
+    assert hamming_distance(sketch_text(" ".join(text)), sketch_text(" ".join(words(2000, seed=3)))) > 10
@@ -0,0 +1,121 @@
+import json
+
+import pytest
+
+from config import settings
+from job_queue import JobQueue
+
+@pytest.fixture
+def queue(redis_client, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_LANES", "recheck,draft")
+    monkeypatch.setattr(settings, "JOB_DEFAULT_LANE", "draft")
+    monkeypatch.setattr(settings, "JOB_MAX_RUNNING_PER_STUDENT", 0)
+    monkeypatch.setattr(settings, "JOB_RETRY_BASE_SECONDS", 0)
+    return JobQueue(redis_client)
+
+def claim_all(queue, worker_id="w1"):
+    claimed = []
+    while True:
+        job = queue.claim(worker_id)
+        if job is None:
+            return claimed
+        claimed.append(job[1]["n"])
+
+def test_students_are_served_round_robin(queue):
+    for n in range(3):
+        queue.enqueue({"n": f"a{n}"}, student_id=1)
+    for n in range(2):
+        queue.enqueue({"n": f"b{n}"}, student_id=2)
+    queue.enqueue({"n": "c0"}, student_id=3)
+
+    assert claim_all(queue) == ["a0", "b0", "c0", "a1", "b1", "a2"]
+
+def test_higher_lane_is_drained_first(queue):
+    queue.enqueue({"n": "draft"}, student_id=1)
+    queue.enqueue({"n": "recheck"}, student_id=2, lane="recheck")
+
+    assert claim_all(queue) == ["recheck", "draft"]
+    assert queue.depth()["pending"] == 0
+
+def test_unknown_lane_is_rejected(queue):
+    with pytest.raises(ValueError):
+        queue.enqueue({"n": 0}, lane="urgent")
+
+def test_per_student_cap_skips_to_other_students(queue, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_MAX_RUNNING_PER_STUDENT", 1)
+    first = queue.enqueue({"n": "a0"}, student_id=1)
+    queue.enqueue({"n": "a1"}, student_id=1)
+    queue.enqueue({"n": "b0"}, student_id=2)
+
+    assert claim_all(queue) == ["a0", "b0"]
+    assert queue.student_backlog(1) == 2
+
+    assert queue.complete(first, "w1")
+    assert claim_all(queue) == ["a1"]
+
+def test_failed_job_is_retried_then_dead_lettered(queue, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_MAX_ATTEMPTS", 2)
+    job_id = queue.enqueue({"n": 0}, student_id=1)
+
+    assert queue.claim("w1")[0] == job_id
+    assert queue.fail(job_id, "w1", "boom") == "retrying"
+    assert queue.status(job_id)["status"] == "retrying"
+
+    # Zero backoff: the retry is due on the next claim
+    assert queue.claim("w1")[0] == job_id
+    assert queue.fail(job_id, "w1", "boom again") == "dead"
+    assert queue.status(job_id)["status"] == "dead"
+    assert queue.claim("w1") is None
+    assert queue.depth()["dead"] == 1
+
+def test_fail_from_a_worker_without_the_lease_is_ignored(queue):
+    job_id = queue.enqueue({"n": 0}, student_id=1)
+    queue.claim("w1")
+
+    assert queue.fail(job_id, "w2", "not mine") is None
+    assert not queue.complete(job_id, "w2")
+    assert queue.status(job_id)["status"] == "running"
+
+def test_expired_lease_is_requeued_at_the_front(queue, monkeypatch):
+    stuck = queue.enqueue({"n": "stuck"}, student_id=1)
+    queue.enqueue({"n": "next"}, student_id=1)
+
+    monkeypatch.setattr(settings, "JOB_LEASE_SECONDS", -1)
+    assert queue.claim("dead-worker")[0] == stuck
+
+    monkeypatch.setattr(settings, "JOB_LEASE_SECONDS", 60)
+    job_id, _ = queue.claim("w2")
+    assert job_id == stuck
+    assert queue.status(stuck)["worker"] == "w2"
+    assert queue.status(stuck)["attempts"] == "2"
+    assert not queue.heartbeat(stuck, "dead-worker")
+    assert queue.heartbeat(stuck, "w2")
+
+def test_expired_lease_past_max_attempts_is_dead_lettered(queue, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_MAX_ATTEMPTS", 1)
+    monkeypatch.setattr(settings, "JOB_LEASE_SECONDS", -1)
+    job_id = queue.enqueue({"n": 0}, student_id=1)
+    queue.claim("dead-worker")
+
+    assert queue.claim("w2") is None
+    assert queue.status(job_id)["status"] == "dead"
+
+def test_legacy_pending_list_is_migrated_in_order(queue, redis_client):
+    # Jobs written before lanes existed: no lane or student on the hash
+    for n in range(5):
+        redis_client.hset(f"analysis:job:old{n}", mapping={"payload": json.dumps({"n": n}), "status": "queued", "attempts": 0})
+        redis_client.lpush("analysis:pending", f"old{n}")
+    redis_client.lpush("analysis:pending", "expired")
+
+    assert queue.migrate_legacy_pending(batch=2) == 5
+    assert not redis_client.exists("analysis:pending")
+    assert queue.depth()["lanes"]["draft"] == 5
+    assert claim_all(queue) == [0, 1, 2, 3, 4]
+    assert queue.status("old0")["lane"] == "draft"
+    assert queue.status("old0")["student"] == JobQueue.ANONYMOUS
+
+def test_legacy_delayed_job_without_lane_is_not_lost(queue, redis_client):
+    redis_client.hset("analysis:job:old", mapping={"payload": json.dumps({"n": "old"}), "status": "retrying", "attempts": 1})
+    redis_client.zadd("analysis:delayed", {"old": 0})
+
+    assert claim_all(queue) == ["old"]
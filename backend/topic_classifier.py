@@ -0,0 +1,277 @@
+import json
+import logging
+import re
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+GENERAL_TOPIC = "General Academic"
+LEVELS = ("Undergraduate", "Graduate", "Advanced/Doctoral")
+# Word-count bands the workflow used on their own; markers now move a document up or down one band
+LEVEL_WORD_BOUNDARIES = (1000, 3000)
+
+DEFAULT_TAXONOMY: Dict[str, List[str]] = {
+    "Machine Learning": [
+        "machine learning", "deep learning", "neural network", "neural networks", "supervised learning",
+        "unsupervised learning", "reinforcement learning", "training data", "training set", "test set",
+        "gradient descent", "overfitting", "classifier", "random forest", "support vector machine",
+        "convolutional", "transformer", "backpropagation", "feature extraction", "hyperparameter",
+    ],
+    "Artificial Intelligence": [
+        "artificial intelligence", "large language model", "large language models", "natural language processing",
+        "computer vision", "expert system", "knowledge representation", "intelligent agent", "generative ai",
+    ],
+    "Computer Science": [
+        "algorithm", "algorithms", "data structure", "data structures", "time complexity", "operating system",
+        "compiler", "distributed system", "distributed systems", "database", "software engineering",
+        "programming language", "computer network", "cybersecurity", "encryption",
+    ],
+    "Climate Change": [
+        "climate change", "global warming", "greenhouse gas", "greenhouse gases", "carbon emissions",
+        "carbon dioxide", "sea level rise", "paris agreement", "fossil fuels", "renewable energy",
+        "ipcc", "net zero", "extreme weather", "carbon footprint", "decarbonisation", "decarbonization",
+    ],
+    "Environmental Science": [
+        "biodiversity", "ecosystem", "ecosystems", "deforestation", "pollution", "conservation",
+        "sustainability", "habitat loss", "water quality", "environmental impact",
+    ],
+    "Psychology": [
+        "psychology", "cognitive", "behaviour", "behavior", "behavioural", "behavioral", "personality",
+        "mental health", "anxiety", "depression", "cognitive behavioural therapy", "cognitive behavioral therapy",
+        "working memory", "developmental psychology", "social psychology", "psychotherapy", "attachment theory",
+    ],
+    "Economics": [
+        "economics", "economic", "inflation", "gdp", "monetary policy", "fiscal policy", "interest rates",
+        "supply and demand", "market equilibrium", "unemployment", "macroeconomic", "microeconomic",
+        "elasticity", "central bank", "trade deficit", "economic growth",
+    ],
+    "Business and Management": [
+        "marketing", "management", "leadership", "organisational", "organizational", "stakeholder",
+        "stakeholders", "business strategy", "competitive advantage", "supply chain", "entrepreneurship",
+        "corporate governance", "human resources", "consumer behaviour", "consumer behavior",
+    ],
+    "Biology": [
+        "biology", "cell", "cells", "dna", "rna", "gene", "genes", "protein", "proteins", "evolution",
+        "natural selection", "photosynthesis", "enzyme", "enzymes", "mitochondria", "genome", "species",
+    ],
+    "Medicine and Health": [
+        "patient", "patients", "clinical", "clinical trial", "diagnosis", "treatment", "disease",
+        "public health", "epidemiology", "vaccine", "vaccination", "nursing", "healthcare", "mortality",
+    ],
+    "Chemistry": [
+        "chemistry", "molecule", "molecules", "chemical reaction", "compound", "compounds", "catalyst",
+        "oxidation", "reduction reaction", "periodic table", "organic chemistry", "titration", "covalent",
+    ],
+    "Physics": [
+        "physics", "quantum", "quantum mechanics", "relativity", "thermodynamics", "electromagnetic",
+        "particle", "particles", "momentum", "velocity", "newton", "energy conservation", "wave function",
+    ],
+    "Mathematics": [
+        "theorem", "proof", "lemma", "calculus", "linear algebra", "equation", "equations", "integral",
+        "derivative", "probability", "matrix", "topology", "differential equation",
+    ],
+    "History": [
+        "history", "historical", "century", "empire", "revolution", "colonial", "colonialism",
+        "world war", "medieval", "renaissance", "cold war", "industrial revolution", "dynasty",
+    ],
+    "Literature": [
+        "novel", "poem", "poetry", "narrative", "narrator", "protagonist", "literary", "shakespeare",
+        "metaphor", "symbolism", "character development", "literary criticism",
+    ],
+    "Sociology": [
+        "sociology", "social class", "inequality", "gender", "ethnicity", "social structure",
+        "socialisation", "socialization", "social movement", "community", "marginalised", "marginalized",
+    ],
+    "Political Science": [
+        "politics", "political", "democracy", "government", "election", "elections", "policy",
+        "international relations", "sovereignty", "legislation", "parliament", "geopolitical",
+    ],
+    "Law": [
+        "law", "legal", "court", "jurisdiction", "statute", "case law", "contract law", "tort",
+        "constitutional", "human rights", "plaintiff", "defendant", "judgment",
+    ],
+    "Education": [
+        "education", "pedagogy", "curriculum", "teaching", "learners", "classroom", "assessment",
+        "higher education", "student engagement", "learning outcomes", "teacher",
+    ],
+    "Philosophy": [
+        "philosophy", "ethics", "ethical", "epistemology", "metaphysics", "moral", "kant", "utilitarianism",
+        "existentialism", "ontology", "virtue ethics",
+    ],
+}
+
+# Scholarly-register phrases; their density pushes the level above what length alone suggests
+DEFAULT_LEVEL_MARKERS: List[str] = [
+    "literature review", "methodology", "theoretical framework", "conceptual framework", "hypothesis",
+    "hypotheses", "research question", "research questions", "empirical", "statistically significant",
+    "regression", "qualitative", "quantitative", "mixed methods", "sample size", "semi structured",
+    "epistemological", "ontological", "paradigm", "limitations", "future research", "et al", "peer reviewed",
+    "meta analysis", "systematic review", "validity", "reliability", "longitudinal", "ethnographic",
+    "thesis", "dissertation", "abstract", "findings", "p value", "confidence interval",
+]
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+class PhraseMatcher:
+    """Word-level Aho-Corasick automaton over a fixed set of phrases.
+
+    Transitions are on whole tokens, so phrases only match on word boundaries
+    and a document is scanned once regardless of how many phrases there are.
+    State can be carried between calls to scan text that arrives in pieces.
+    """
+
+    def __init__(self, phrases: Sequence[Sequence[str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+
+        for phrase_id, tokens in enumerate(phrases):
+            node = 0
+            for token in tokens:
+                nxt = self._goto[node].get(token)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][token] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                node = nxt
+            self._out[node] += (phrase_id,)
+
+        pending = deque(self._goto[0].values())
+        while pending:
+            node = pending.popleft()
+            for token, child in self._goto[node].items():
+                pending.append(child)
+                fallback = self._fail[node]
+                while fallback and token not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(token, 0)
+                self._out[child] += self._out[self._fail[child]]
+
+    def scan(self, tokens: Iterable[str], state: int = 0) -> Tuple[List[int], int]:
+        """Phrase ids found in tokens, and the state to resume from"""
+        goto, fail, out = self._goto, self._fail, self._out
+        found: List[int] = []
+        for token in tokens:
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            if out[state]:
+                found.extend(out[state])
+        return found, state
+
+class DocumentScan:
+    """Running phrase counts for one document fed page by page"""
+
+    def __init__(self, classifier: "TopicClassifier"):
+        self._classifier = classifier
+        self._state = 0
+        self._ids: List[int] = []
+
+    def feed(self, text: str):
+        found, self._state = self._classifier.matcher.scan(tokenize(text), self._state)
+        self._ids.extend(found)
+
+    def tap(self, pages: Iterable[str]) -> Iterator[str]:
+        """Pass a page stream through unchanged while scanning it"""
+        for page in pages:
+            self.feed(page)
+            yield page
+
+    def result(self, word_count: int) -> Dict[str, str]:
+        return self._classifier.decide([self._ids], [word_count])[0]
+
+class TopicClassifier:
+    """Full-text topic and academic-level classifier over a keyword taxonomy.
+
+    Each topic scores the summed weight of its phrases found in the document
+    (multi-word phrases weigh more). The level starts from the word-count
+    band and moves up or down one band by the density of scholarly-register
+    markers. Batches are scored with one matrix of counts.
+    """
+
+    def __init__(self, taxonomy: Dict[str, List[str]], level_markers: List[str]):
+        self.topics = list(taxonomy)
+        self._level_column = len(self.topics)
+
+        phrases: List[List[str]] = []
+        columns: List[int] = []
+        for column, topic in enumerate(self.topics):
+            for phrase in taxonomy[topic]:
+                phrases.append(tokenize(phrase))
+                columns.append(column)
+        self._first_marker = len(phrases)
+        for phrase in level_markers:
+            phrases.append(tokenize(phrase))
+            columns.append(self._level_column)
+
+        self.matcher = PhraseMatcher(phrases)
+        self._columns = np.asarray(columns, dtype=np.int64)
+        self._weights = np.asarray([len(tokens) for tokens in phrases], dtype=np.float64)
+        self._topic_names = np.asarray(self.topics + [GENERAL_TOPIC], dtype=object)
+        self._level_names = np.asarray(LEVELS, dtype=object)
+
+    def scanner(self) -> DocumentScan:
+        return DocumentScan(self)
+
+    def classify(self, text: str, word_count: Optional[int] = None) -> Dict[str, str]:
+        return self.classify_batch([text], None if word_count is None else [word_count])[0]
+
+    def classify_batch(self, texts: Sequence[str], word_counts: Optional[Sequence[int]] = None) -> List[Dict[str, str]]:
+        token_lists = [tokenize(text) for text in texts]
+        if word_counts is None:
+            word_counts = [len(text.split()) for text in texts]
+        ids = [self.matcher.scan(tokens)[0] for tokens in token_lists]
+        return self.decide(ids, word_counts)
+
+    def decide(self, ids_per_doc: Sequence[List[int]], word_counts: Sequence[int]) -> List[Dict[str, str]]:
+        n_docs = len(ids_per_doc)
+        rows = np.repeat(np.arange(n_docs), [len(ids) for ids in ids_per_doc])
+        ids = np.fromiter((i for doc in ids_per_doc for i in doc), dtype=np.int64, count=len(rows))
+
+        scores = np.zeros((n_docs, self._level_column + 1))
+        np.add.at(scores, (rows, self._columns[ids]), self._weights[ids])
+
+        topic_scores = scores[:, :self._level_column]
+        best = topic_scores.argmax(axis=1)
+        confident = topic_scores[np.arange(n_docs), best] >= settings.TOPIC_MIN_SCORE
+        topics = self._topic_names[np.where(confident, best, len(self.topics))]
+
+        word_counts = np.asarray(word_counts, dtype=np.float64)
+        marker_hits = ids >= self._first_marker
+        distinct = np.zeros(n_docs)
+        if marker_hits.any():
+            pairs = np.unique(np.stack([rows[marker_hits], ids[marker_hits]]), axis=1)
+            np.add.at(distinct, pairs[0], 1)
+        density = scores[:, self._level_column] * 1000 / np.maximum(word_counts, 1)
+
+        band = np.searchsorted(LEVEL_WORD_BOUNDARIES, word_counts, side="right")
+        shift = np.where(
+            (density >= settings.LEVEL_MARKER_DENSITY_HIGH) & (distinct >= settings.LEVEL_MIN_DISTINCT_MARKERS), 1,
+            np.where(density < settings.LEVEL_MARKER_DENSITY_LOW, -1, 0)
+        )
+        levels = self._level_names[np.clip(band + shift, 0, len(LEVELS) - 1)]
+
+        return [{"topic": topic, "academic_level": level} for topic, level in zip(topics, levels)]
+
+def _load_taxonomy() -> Tuple[Dict[str, List[str]], List[str]]:
+    if not settings.TOPIC_TAXONOMY_PATH:
+        return DEFAULT_TAXONOMY, DEFAULT_LEVEL_MARKERS
+    try:
+        with open(settings.TOPIC_TAXONOMY_PATH) as f:
+            data = json.load(f)
+        return data["topics"], data.get("level_markers", DEFAULT_LEVEL_MARKERS)
+    except Exception as e:
+        logger.error(f"Could not load topic taxonomy from {settings.TOPIC_TAXONOMY_PATH}, using defaults: {e}")
+        return DEFAULT_TAXONOMY, DEFAULT_LEVEL_MARKERS
+
+topic_classifier = TopicClassifier(*_load_taxonomy())
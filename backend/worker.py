@@ -0,0 +1,85 @@
+"""Analysis worker: claims jobs from the Redis queue and runs them.
+
+Run any number of these on any number of nodes:
+
+    python worker.py
+"""
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import settings
+from job_queue import job_queue
+from analysis_pipeline import dispatch_analysis
+from notifications import publish_status
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("worker")
+
+def _keep_lease(job_id: str, worker_id: str, done: threading.Event):
+    interval = max(settings.JOB_LEASE_SECONDS / 3, 1)
+    while not done.wait(interval):
+        # A slot busy with a long job is still capacity; keep it counted
+        job_queue.worker_seen(worker_id)
+        if not job_queue.heartbeat(job_id, worker_id):
+            logger.warning(f"Lost lease on job {job_id}; it will be retried elsewhere")
+            return
+
+def worker_loop(worker_id: str, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            job_queue.worker_seen(worker_id)
+            claimed = job_queue.claim(worker_id)
+        except Exception as e:
+            logger.error(f"Claim failed: {e}")
+            stop.wait(settings.WORKER_POLL_INTERVAL_SECONDS)
+            continue
+
+        if claimed is None:
+            stop.wait(settings.WORKER_POLL_INTERVAL_SECONDS)
+            continue
+
+        job_id, payload = claimed
+        assignment_id = payload.get("assignment_id")
+        publish_status(assignment_id, "running", job_id=job_id)
+        done = threading.Event()
+        threading.Thread(target=_keep_lease, args=(job_id, worker_id, done), daemon=True).start()
+        started = time.monotonic()
+        try:
+            dispatch_analysis(payload)
+            job_queue.complete(job_id, worker_id)
+            job_queue.record_duration(time.monotonic() - started)
+            logger.info(f"Job {job_id} (assignment {assignment_id}) done in {time.monotonic() - started:.1f}s")
+        except Exception as e:
+            outcome = job_queue.fail(job_id, worker_id, str(e))
+            if outcome:
+                publish_status(assignment_id, "failed" if outcome == "dead" else "retrying", job_id=job_id, error=str(e))
+            logger.error(f"Job {job_id} (assignment {assignment_id}) failed, {outcome}: {e}")
+        finally:
+            done.set()
+
+def main():
+    if job_queue is None:
+        raise SystemExit("Job queue is not available; check REDIS_HOST/REDIS_PORT and JOB_QUEUE_ENABLED")
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    base_id = f"{socket.gethostname()}:{os.getpid()}"
+    logger.info(f"Worker {base_id} starting {settings.WORKER_CONCURRENCY} slots")
+
+    with ThreadPoolExecutor(max_workers=settings.WORKER_CONCURRENCY) as pool:
+        for slot in range(settings.WORKER_CONCURRENCY):
+            pool.submit(worker_loop, f"{base_id}:{slot}", stop)
+        try:
+            while not stop.is_set():
+                stop.wait(1)
+        except KeyboardInterrupt:
+            stop.set()
+        logger.info("Stopping; in-flight jobs will finish")
+
+if __name__ == "__main__":
+    main()
@@ -20,9 +20,34 @@ CREATE TABLE IF NOT EXISTS assignments (
     topic TEXT,
     academic_level TEXT,
     word_count INTEGER DEFAULT 0,
+    page_map JSONB,
+    content_digest VARCHAR(64),
+    similarity_sketch BIGINT,
     uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Content-addressed upload blobs (files stored by sha256, reference counted)
+CREATE TABLE IF NOT EXISTS upload_blobs (
+    digest VARCHAR(64) PRIMARY KEY,
+    size BIGINT NOT NULL,
+    ref_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    released_at TIMESTAMP
+);
+
+-- Assignment chunks (streamed uploads are embedded and stored chunk by chunk)
+CREATE TABLE IF NOT EXISTS assignment_chunks (
+    id SERIAL PRIMARY KEY,
+    assignment_id INTEGER NOT NULL REFERENCES assignments(id) ON DELETE CASCADE,
+    chunk_index INTEGER NOT NULL,
+    page INTEGER,
+    content_hash VARCHAR(64) NOT NULL,
+    content TEXT,
+    embedding vector(768),
+    flags JSONB,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Analysis results table
 CREATE TABLE IF NOT EXISTS analysis_results (
     id SERIAL PRIMARY KEY,
@@ -33,6 +58,9 @@ CREATE TABLE IF NOT EXISTS analysis_results (
     research_suggestions TEXT,
     citation_recommendations TEXT,
     confidence_score FLOAT DEFAULT 0.0,
+    reused_from_assignment_id INTEGER,
+    degradation_level INTEGER DEFAULT 0,
+    degraded_stages JSONB,
     analyzed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -49,12 +77,39 @@ CREATE TABLE IF NOT EXISTS academic_sources (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Columns added after the tables above were first created; CREATE TABLE IF NOT
+-- EXISTS leaves an existing table alone, so add them here for older databases
+ALTER TABLE assignments ADD COLUMN IF NOT EXISTS page_map JSONB;
+ALTER TABLE assignments ADD COLUMN IF NOT EXISTS content_digest VARCHAR(64);
+ALTER TABLE assignments ADD COLUMN IF NOT EXISTS similarity_sketch BIGINT;
+ALTER TABLE assignment_chunks ADD COLUMN IF NOT EXISTS flags JSONB;
+ALTER TABLE analysis_results ADD COLUMN IF NOT EXISTS reused_from_assignment_id INTEGER;
+ALTER TABLE analysis_results ADD COLUMN IF NOT EXISTS degradation_level INTEGER DEFAULT 0;
+ALTER TABLE analysis_results ADD COLUMN IF NOT EXISTS degraded_stages JSONB;
+
 -- Create indexes for better query performance
 CREATE INDEX IF NOT EXISTS idx_students_email ON students(email);
 CREATE INDEX IF NOT EXISTS idx_students_student_id ON students(student_id);
 CREATE INDEX IF NOT EXISTS idx_assignments_student_id ON assignments(student_id);
-CREATE INDEX IF NOT EXISTS idx_analysis_assignment_id ON analysis_results(assignment_id);
+CREATE INDEX IF NOT EXISTS idx_assignments_content_digest ON assignments(content_digest);
+CREATE INDEX IF NOT EXISTS idx_assignments_student_uploaded ON assignments(student_id, uploaded_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_upload_blobs_unreferenced ON upload_blobs(released_at) WHERE ref_count <= 0;
+CREATE INDEX IF NOT EXISTS idx_assignment_chunks_assignment_id ON assignment_chunks(assignment_id);
+CREATE INDEX IF NOT EXISTS idx_assignment_chunks_content_hash ON assignment_chunks(content_hash);
+-- One result per assignment (upserts use ON CONFLICT (assignment_id)).
+-- Databases created before this had a plain index under idx_analysis_assignment_id
+-- and may hold duplicates: keep the newest row, drop the old index, add the unique one.
+-- Safe to re-run against an existing database with psql -f init.sql.
+DELETE FROM analysis_results older
+USING analysis_results newer
+WHERE older.assignment_id = newer.assignment_id
+  AND (coalesce(older.analyzed_at, '-infinity'), older.id) < (coalesce(newer.analyzed_at, '-infinity'), newer.id);
+DROP INDEX IF EXISTS idx_analysis_assignment_id;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_analysis_results_assignment_id ON analysis_results(assignment_id);
 CREATE INDEX IF NOT EXISTS idx_academic_sources_type ON academic_sources(source_type);
+-- Lexical fallback search when there is no time for vector retrieval
+CREATE INDEX IF NOT EXISTS idx_academic_sources_fts ON academic_sources
+USING GIN (to_tsvector('english', coalesce(title, '') || ' ' || coalesce(abstract, '')));
 
 -- Create index for vector similarity search
 CREATE INDEX IF NOT EXISTS idx_academic_sources_embedding ON academic_sources
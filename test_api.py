@@ -119,32 +119,64 @@ def test_upload(token):
         print(f"Error: {response.text}")
         return None
 
-def test_get_analysis(token, assignment_id, max_retries=10):
+def test_get_analysis(token, assignment_id, timeout=120):
     print(f"\n=== Testing Get Analysis (Assignment ID: {assignment_id}) ===")
 
-    headers = {"Authorization": f"Bearer {token}"}
+    headers = {"Authorization": f"Bearer {token}", "Accept": "text/event-stream"}
+    url = f"{BASE_URL}/analysis/{assignment_id}/events"
+    print("Subscribing to:", url)
+
+    # One streaming request instead of polling; the server pushes each status change
+    try:
+        with requests.get(url, headers=headers, stream=True, timeout=timeout) as response:
+            print(f"Status: {response.status_code}")
+            if response.status_code != 200:
+                print(f"Error: {response.text}")
+                return False
+
+            deadline = time.time() + timeout
+            for line in response.iter_lines(decode_unicode=True):
+                if time.time() > deadline:
+                    break
+                if not line or not line.startswith("data:"):
+                    continue
+                event = json.loads(line[len("data:"):])
+                print(f"Status update: {event['status']}")
+
+                if event["status"] == "completed":
+                    print(f"\n✅ Analysis Complete!")
+                    print(json.dumps(event["result"], indent=2))
+                    return True
+                if event["status"] == "failed":
+                    print(f"Error: {event.get('error')}")
+                    return False
+    except requests.exceptions.Timeout:
+        pass
+
+    print("⚠️  Analysis not completed within timeout period")
+    return False
+
+def test_list_assignments(token, assignment_id):
+    print("\n=== Testing Assignment History ===")
 
-    for attempt in range(max_retries):
-        print(f"Attempt {attempt + 1}/{max_retries}...")
-        print("Making request to:", f"{BASE_URL}/analysis/{assignment_id}")
-        print("Using headers:", headers)
-        response = requests.get(f"{BASE_URL}/analysis/{assignment_id}", headers=headers)
-        print(f"Status: {response.status_code}")
-
-        if response.status_code == 200:
-            result = response.json()
-            print(f"\n✅ Analysis Complete!")
-            print(json.dumps(result, indent=2))
-            return True
-        elif response.status_code == 404:
-            print("Analysis not ready yet, waiting 3 seconds...")
-            time.sleep(3)
-        else:
+    headers = {"Authorization": f"Bearer {token}"}
+    items, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = requests.get(f"{BASE_URL}/assignments", headers=headers, params=params)
+        if response.status_code != 200:
             print(f"Error: {response.text}")
             return False
+        page = response.json()
+        items.extend(page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
 
-    print("⚠️  Analysis not completed within timeout period")
-    return False
+    print(f"Found {len(items)} assignments")
+    for item in items:
+        print(f"- #{item['assignment_id']} {item['filename']}: {item['status']}")
+    return any(item["assignment_id"] == assignment_id for item in items)
 
 def test_search_sources(token):
     print("\n=== Testing Source Search ===")
@@ -200,7 +232,6 @@ def main():
     print(f"Assignment ID: {assignment_id}")
 
     print("\n⏳ Waiting for n8n workflow to process...")
-    time.sleep(5)
 
     if test_get_analysis(token, assignment_id):
         print("\n✅ Analysis retrieval successful!")
@@ -208,6 +239,9 @@ def main():
         print("\n⚠️  Analysis may still be processing. Check later with:")
         print(f"   curl -H 'Authorization: Bearer {token}' {BASE_URL}/analysis/{assignment_id}")
 
+    if test_list_assignments(token, assignment_id):
+        print("\n✅ Assignment history successful!")
+
     if test_search_sources(token):
         print("\n✅ Source search successful!")
 